@@ -417,7 +417,8 @@ def save_reconciliation_report(collection_name: str, invoice_no: str,
         
         # Structure the data
         summary = summary_data.to_dict(orient='records') if hasattr(summary_data, 'to_dict') else summary_data
-        lines = line_items_data.to_dict(orient='records') if hasattr(line_items_data, 'to_dict') else line_items_data
+        # Only the first 5000 lines are stored, so only those are converted to records
+        lines = line_items_data.head(5000).to_dict(orient='records') if hasattr(line_items_data, 'head') else line_items_data
         
         document = {
             "invoice_no": invoice_no,
@@ -333,6 +333,25 @@ def to_excel(df: pd.DataFrame, apply_doc_formatting: bool = False, sheet_name: s
     return output.getvalue()
 
 
+@st.cache_data(show_spinner=False)
+def to_parquet(df: pd.DataFrame) -> bytes:
+    """
+    Convert DataFrame to zstd-compressed Parquet bytes.
+    Cached on the DataFrame contents so repeated reruns don't re-encode.
+    """
+    output = BytesIO()
+    try:
+        df.to_parquet(output, engine='pyarrow', compression='zstd', index=False)
+    except (TypeError, ValueError):
+        # Mixed-type object columns (common in Excel uploads) can't be typed by Arrow
+        output = BytesIO()
+        object_cols = df.select_dtypes(include='object').columns
+        df.astype({col: str for col in object_cols}).to_parquet(
+            output, engine='pyarrow', compression='zstd', index=False
+        )
+    return output.getvalue()
+
+
 def to_multi_sheet_excel(reports: Dict[str, pd.DataFrame]) -> bytes:
     """
     Convert multiple DataFrames to a multi-sheet Excel file.
@@ -345,7 +364,10 @@ def to_multi_sheet_excel(reports: Dict[str, pd.DataFrame]) -> bytes:
     """
     output = BytesIO()
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+    # xlsxwriter streams the XML out instead of building an openpyxl object tree.
+    # constant_memory stays off: to_excel writes column by column, which that mode drops.
+    with pd.ExcelWriter(output, engine='xlsxwriter',
+                        engine_kwargs={'options': {'strings_to_urls': False}}) as writer:
         for sheet_name, df in reports.items():
             # Clean sheet name (Excel has 31 char limit and special char restrictions)
             clean_name = str(sheet_name)[:31].replace('/', '-').replace('\\', '-')
@@ -756,6 +778,29 @@ def display_dataframe(df: pd.DataFrame, height: int = 400, use_container_width:
     st.dataframe(df, use_container_width=use_container_width, height=height)
 
 
+def paged_view(df: pd.DataFrame, key: str, page_size: int = 100) -> pd.DataFrame:
+    """
+    Render a page selector and return only that page of the DataFrame.
+    
+    Streamlit then serializes one page per rerun instead of the whole frame.
+    
+    Args:
+        df: DataFrame to page through
+        key: Unique key for the page selector
+        page_size: Rows per page
+    """
+    pages = max(1, -(-len(df) // page_size))
+    if pages == 1:
+        return df
+    
+    page = st.number_input(
+        f"Page (of {pages:,}, {page_size} rows each)",
+        min_value=1, max_value=pages, value=1, step=1, key=f"pg_{key}"
+    )
+    start = (int(page) - 1) * page_size
+    return df.iloc[start:start + page_size]
+
+
 def create_download_section(reports: Dict[str, pd.DataFrame], module_name: str,
                             section_title: str = "📥 Download Reports"):
     """
@@ -800,7 +845,7 @@ def create_download_section(reports: Dict[str, pd.DataFrame], module_name: str,
 def download_module_report(df: pd.DataFrame, module_name: str, report_name: str,
                            button_label: str = "📥 Download", key: str = None,
                            apply_doc_formatting: bool = False,
-                           tool_name: str = None) -> bool:
+                           tool_name: str = None, file_format: str = "xlsx") -> bool:
     """
     Download button that AUTOMATICALLY saves report to MongoDB when called.
     Also logs download event when user clicks the download button.
@@ -815,6 +860,7 @@ def download_module_report(df: pd.DataFrame, module_name: str, report_name: str,
         key: Unique key for the button
         apply_doc_formatting: Whether to apply DOC column formatting
         tool_name: Name of the tool that generated this report (auto-detected if not provided)
+        file_format: "xlsx" (default) or "parquet" for large raw-data exports
     
     Returns:
         True if download was clicked
@@ -903,10 +949,15 @@ def download_module_report(df: pd.DataFrame, module_name: str, report_name: str,
     
     # Generate filename with timestamp
     base_filename = report_name.replace(" ", "_").lower()
-    filename = get_download_filename(base_filename)
+    filename = get_download_filename(base_filename, file_format)
     
-    # Convert to Excel
-    excel_data = to_excel(df, apply_doc_formatting, report_name[:31])
+    # Convert to the requested format
+    if file_format == "parquet":
+        file_data = to_parquet(df)
+        mime = "application/vnd.apache.parquet"
+    else:
+        file_data = to_excel(df, apply_doc_formatting, report_name[:31])
+        mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     
     # Create download button with stable key
     btn_key = key or f"dl_{module_name}_{report_name.replace(' ', '_')}_{hash(report_name) % 10000}"
@@ -929,9 +980,9 @@ def download_module_report(df: pd.DataFrame, module_name: str, report_name: str,
     
     downloaded = st.download_button(
         label=button_label,
-        data=excel_data,
+        data=file_data,
         file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        mime=mime,
         key=btn_key
     )
     
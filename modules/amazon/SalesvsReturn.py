@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import zipfile
 import io
 import gc
@@ -8,13 +9,33 @@ import base64
 import traceback
 import tempfile
 import os
+import atexit
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Prefer the Rust-based calamine reader (no XML DOM); fall back to openpyxl
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
 
 from common.ui_utils import (
     apply_professional_style, 
     get_download_filename, 
     render_header,
     download_module_report,
-    auto_save_generated_reports
+    auto_save_generated_reports,
+    paged_view
 )
 from common.mongo import save_reconciliation_report
 
@@ -22,6 +43,33 @@ from common.mongo import save_reconciliation_report
 MODULE_NAME = "amazon"
 TOOL_NAME = "amazon_sales_vs_return"
 
+# Purchase Master columns used by the merges and the ASIN summary
+PM_COLUMNS = ["ASIN", "Brand", "Brand Manager", "Vendor SKU Codes", "CP", "Product Name"]
+
+# Zips parsed ahead of the CSV writer; each parsed zip is held in memory until written
+ZIP_PARSE_WINDOW = 2
+
+# Below this many rows the NumPy return totals finish before numba could compile its
+# kernel. The kernel is not cached on disk: pages are exec'd under an unregistered
+# module name, and numba cannot reload a cached kernel from such a module
+NUMBA_MIN_ROWS = 1_000_000
+
+# Frames larger than this also get a Parquet download next to the XLSX one
+PARQUET_ROW_THRESHOLD = 100_000
+
+# (file name, results key) of the reports bundled into the analysis ZIP
+ZIP_REPORTS = (
+    ("brand_final", "brand_final"),
+    ("asin_final", "asin_final"),
+    ("brand_qty_pivot", "brand_qty_pivot"),
+    ("asin_qty_pivot", "asin_qty_pivot"),
+    ("seller_flex_brand", "seller_flex_brand"),
+    ("seller_flex_asin", "seller_flex_asin"),
+    ("fba_return_brand", "fba_return_brand"),
+    ("fba_return_asin", "fba_return_asin"),
+    ("fba_disposition", "fba_disposition_pivot"),
+)
+
 # Page configuration
 st.set_page_config(
     page_title="Sales vs Return Data Analyzer",
@@ -55,87 +103,167 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Helper Functions
+def read_csv_arrow(f, column_types=None):
+    """Parse a CSV into Arrow-backed columns with PyArrow's multithreaded reader.
+
+    Falls back to pandas when a column's inferred type clashes later in the file.
+    """
+    try:
+        table = pa_csv.read_csv(
+            f,
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types or {},
+                strings_can_be_null=True
+            )
+        )
+    except pa.ArrowInvalid:
+        f.seek(0)
+        return pd.read_csv(f, low_memory=True, dtype_backend="pyarrow")
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+def parse_zip_bytes(data: bytes, name: str) -> pd.DataFrame:
+    """Parse every sheet/CSV inside one uploaded zip."""
+    # Define common dtypes to save memory during read
+    column_types = {
+        "Quantity": pa.float32(),
+        "Invoice Amount": pa.float32()
+    }
+    
+    frames = []
+    with zipfile.ZipFile(io.BytesIO(data), 'r') as z:
+        for file_name in z.namelist():
+            if file_name.endswith(('.xlsx', '.xls', '.csv')):
+                with z.open(file_name) as f:
+                    if file_name.endswith('.csv'):
+                        df = read_csv_arrow(f, column_types)
+                    else:
+                        # Arrow-backed strings concat without boxing each value
+                        df = pd.read_excel(f, engine=EXCEL_ENGINE, dtype_backend="pyarrow")
+                
+                df["Source_Zip"] = name
+                df["Source_File"] = file_name
+                
+                # Normalize column names
+                new_cols = []
+                seen = {}
+                for c in df.columns:
+                    base = str(c).strip().title()
+                    if base in seen:
+                        seen[base] += 1
+                        new_cols.append(f"{base}_{seen[base]}")
+                    else:
+                        seen[base] = 0
+                        new_cols.append(base)
+                df.columns = new_cols
+                frames.append(df)
+    
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def read_csv_bytes(data: bytes) -> pd.DataFrame:
+    """Parse an uploaded CSV with PyArrow's threaded reader, cached on its bytes.
+
+    Columns Arrow would infer as dates/timestamps, or as all-null, are pinned to
+    strings so the report text comes through as pandas would have read it.
+    """
+    try:
+        schema = pa_csv.open_csv(io.BytesIO(data)).schema
+        column_types = {
+            field.name: pa.string() for field in schema
+            if pa.types.is_temporal(field.type) or pa.types.is_null(field.type)
+        }
+        table = pa_csv.read_csv(
+            io.BytesIO(data),
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types,
+                strings_can_be_null=True
+            )
+        )
+    except pa.ArrowInvalid:
+        return pd.read_csv(io.BytesIO(data))
+    return table.to_pandas()
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def read_product_master_bytes(data: bytes) -> pd.DataFrame:
+    """Parse the purchase master, cached on its bytes; only the used columns are read."""
+    return pd.read_excel(
+        io.BytesIO(data),
+        # openpyxl cannot open legacy .xls, so let pandas pick when calamine is absent
+        engine="calamine" if EXCEL_ENGINE == "calamine" else None,
+        usecols=lambda col: col in PM_COLUMNS
+    )
+
+def parse_zips_in_order(zip_files):
+    """Yield (zip_file, future) in upload order, parsing at most ZIP_PARSE_WINDOW ahead.
+
+    zlib inflate and the calamine/PyArrow readers release the GIL, so the next
+    zip parses on a thread while the caller writes the current one out.
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=ZIP_PARSE_WINDOW) as pool:
+        for zip_file in zip_files:
+            pending.append((zip_file, pool.submit(parse_zip_bytes, zip_file.getvalue(), zip_file.name)))
+            if len(pending) >= ZIP_PARSE_WINDOW:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+
 def read_zip_files_to_disk(zip_files):
     """Read data from multiple zip files and write directly to a temp CSV on disk to save RAM."""
     temp_csv = tempfile.NamedTemporaryFile(delete=False, suffix='.csv')
     temp_path = temp_csv.name
     temp_csv.close()
+    atexit.register(remove_temp_file, temp_path)
     
     first_file = True
     total_count = 0
     
-    # Define common dtypes to save memory during read
-    dtypes = {
-        "Transaction Type": "category",
-        "Quantity": "float32",
-        "Invoice Amount": "float32"
-    }
-    
-    for zip_file in zip_files:
+    for zip_file, future in parse_zips_in_order(zip_files):
         try:
-            with zipfile.ZipFile(zip_file, 'r') as z:
-                for file_name in z.namelist():
-                    if file_name.endswith(('.xlsx', '.xls', '.csv')):
-                        with z.open(file_name) as f:
-                            if file_name.endswith('.csv'):
-                                df = pd.read_csv(f, low_memory=True, dtype=dtypes)
-                            else:
-                                df = pd.read_excel(f, engine='openpyxl')
-                            
-                            df["Source_Zip"] = zip_file.name
-                            df["Source_File"] = file_name
-                            
-                            # Normalize column names
-                            new_cols = []
-                            seen = {}
-                            for c in df.columns:
-                                base = str(c).strip().title()
-                                if base in seen:
-                                    seen[base] += 1
-                                    new_cols.append(f"{base}_{seen[base]}")
-                                else:
-                                    seen[base] = 0
-                                    new_cols.append(base)
-                            df.columns = new_cols
-                            
-                            total_count += len(df)
-                            
-                            # Write to disk
-                            df.to_csv(temp_path, mode='a', index=False, header=first_file)
-                            first_file = False
-                            
-                            # Clear memory immediately
-                            del df
-                            gc.collect()
+            df = future.result()
+            if df.empty:
+                continue
+            
+            total_count += len(df)
+            
+            # Write to disk
+            df.to_csv(temp_path, mode='a', index=False, header=first_file)
+            first_file = False
+            
+            # Clear memory immediately; the future holds the frame as well
+            del df, future
+            gc.collect()
         except Exception as e:
             st.warning(f"Could not read zip file {zip_file.name}: {str(e)}")
             
     return temp_path, total_count
 
-def add_grand_total(df):
-    """Add a Grand Total row to the dataframe for numeric columns"""
+def grand_total_row(df):
+    """Build the Grand Total row for numeric columns, or None when there is nothing to total"""
     if df is None or df.empty:
-        return df
+        return None
     
     # Identify numeric columns
     exclude_cols = ['ASIN', 'Asin', 'asin', 'CP']
-    numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-    numeric_cols = [col for col in numeric_cols if col not in exclude_cols]
+    numeric_cols = df.select_dtypes(include=['number']).columns.difference(exclude_cols, sort=False)
     
-    if not numeric_cols:
-        return df
+    if numeric_cols.empty:
+        return None
         
-    # Create total row
-    total_row = {}
-    for col in df.columns:
-        if col in numeric_cols:
-            if col == "Return In %":
-                total_row[col] = 0
-            else:
-                total_row[col] = df[col].sum()
-        else:
-            total_row[col] = ""
-            
+    # One reduction over the numeric block; the mixed block sum upcasts to
+    # float, so integer columns are cast back to keep their dtype.
+    totals = df[numeric_cols].sum()
+    is_int = [dtype.kind in 'iu' for dtype in df.dtypes[numeric_cols]]
+    total_row = dict.fromkeys(df.columns, "")
+    total_row.update(
+        (col, int(val) if as_int else val)
+        for col, val, as_int in zip(numeric_cols, totals.tolist(), is_int)
+    )
+    
     # Set Grand Total label in the first column
     first_col = df.columns[0]
     total_row[first_col] = "Grand Total"
@@ -150,48 +278,119 @@ def add_grand_total(df):
         elif "Return In %" in numeric_cols:
              total_row["Return In %"] = 0
 
-    return pd.concat([df, pd.DataFrame([total_row])], ignore_index=True)
+    return total_row
+
+def append_row(df, row):
+    """Return a new frame with a {column: value} row appended; df is left unchanged."""
+    # Append by enlargement on a shallow copy rather than concatenating a one-row
+    # frame: the copy gets a fresh 0..n-1 label set (as ignore_index gave) without
+    # touching the data blocks, and the enlargement never reaches the caller's frame.
+    df = df.copy(deep=False)
+    df.index = pd.RangeIndex(len(df))
+    df.loc[len(df)] = list(row.values())
+    return df
+
+def add_grand_total(df):
+    """Add a Grand Total row to the dataframe for numeric columns"""
+    total_row = grand_total_row(df)
+    if total_row is None:
+        return df
+    return append_row(df, total_row)
+
+def remove_temp_file(path):
+    """Delete a temp file if it is still there."""
+    if path and os.path.exists(path):
+        try: os.remove(path)
+        except: pass
+
+def persist_frame(df, name):
+    """Park a large row-level result in a temp Feather file instead of session state.
+
+    The Grand Total row is kept alongside rather than written, because its blank
+    cells in numeric columns are not representable in a typed Arrow column.
+    Returns the frame with its total appended if it cannot be written.
+    """
+    if df is None:
+        return None
+    total_row = grand_total_row(df)
+    # A fresh name per run, so sessions uploading the same files never share one
+    temp_file = tempfile.NamedTemporaryFile(delete=False, prefix=f"svr_{name}_", suffix='.feather')
+    path = temp_file.name
+    temp_file.close()
+    atexit.register(remove_temp_file, path)
+    try:
+        df.reset_index(drop=True).to_feather(path, compression='zstd')
+    except Exception:
+        remove_temp_file(path)
+        return df if total_row is None else append_row(df, total_row)
+    return {'path': path, 'grand_total': total_row}
+
+def load_frame(stored):
+    """Return a result stored by persist_frame as a DataFrame."""
+    if not isinstance(stored, dict):
+        return stored
+    df = pd.read_feather(stored['path'])
+    if stored['grand_total'] is not None:
+        df = append_row(df, stored['grand_total'])
+    return df
+
+def remove_temp_results(results):
+    """Delete the temp files this session's previous run created."""
+    paths = [results.get('raw_csv_path')]
+    paths += [v['path'] for v in results.values() if isinstance(v, dict) and 'path' in v]
+    for old_path in paths:
+        remove_temp_file(old_path)
 
 def ensure_arrow_compatibility(df: pd.DataFrame) -> pd.DataFrame:
     """Faster version of Arrow compatibility check."""
     if df is None or df.empty:
         return df
     
-    # Process only object columns
+    # Process only object columns, converted as one block in a single assignment
     obj_cols = df.select_dtypes(include=['object']).columns
-    for col in obj_cols:
-        df[col] = df[col].astype(str).replace(['nan', 'None', 'NaN', 'NAT', 'nat'], '')
+    if len(obj_cols):
+        df[obj_cols] = df[obj_cols].astype(str).replace(['nan', 'None', 'NaN', 'NAT', 'nat'], '')
+    
+    # Category columns keep their codes; missing values become blank like above
+    for col in df.select_dtypes(include=['category']).columns:
+        if df[col].hasnans:
+            if "" not in df[col].cat.categories:
+                df[col] = df[col].cat.add_categories([""])
+            df[col] = df[col].fillna("")
     
     return df
 
 def process_combined_data(combined_df):
     """Filter and clean combined data"""
-    # Filter for Shipment transactions only
-    mask = combined_df["Transaction Type"].astype(str).str.strip().str.lower() == "shipment"
-    combined_df = combined_df[mask].copy()
+    # Normalise the few distinct Transaction Type labels rather than every row;
+    # the trailing False covers the -1 code of missing values
+    transaction_type = combined_df["Transaction Type"].astype("category")
+    labels = transaction_type.cat.categories.astype(str).str.strip().str.lower()
+    is_shipment = np.append(labels == "shipment", False)[transaction_type.cat.codes.to_numpy()]
     
-    # Remove zero invoice amounts
-    combined_df["Invoice Amount"] = pd.to_numeric(combined_df["Invoice Amount"], errors="coerce")
-    combined_df = combined_df[combined_df["Invoice Amount"] != 0]
-    
-    # Remove Return Type if exists
-    if "Return Type" in combined_df.columns:
-        combined_df = combined_df.drop(columns=["Return Type"])
+    # Keep Shipment transactions with a non-zero invoice amount in one pass,
+    # projecting out Return Type in the same selection
+    invoice = pd.to_numeric(combined_df["Invoice Amount"], errors="coerce").to_numpy()
+    mask = is_shipment & (invoice != 0)
+    keep_cols = [c for c in combined_df.columns if c != "Return Type"]
+    combined_df = combined_df.loc[mask, keep_cols].assign(**{
+        "Transaction Type": transaction_type[mask],
+        "Invoice Amount": invoice[mask]
+    })
     
     return combined_df
 
-def merge_product_master(df, pm_df):
+def index_product_master(pm_df):
+    """Deduplicate the purchase master on ASIN and index it once for every join.
+
+    ASIN is kept as a column as well, so joins reproduce the merge output.
+    """
+    return pm_df.drop_duplicates(subset=["ASIN"]).set_index("ASIN", drop=False).rename_axis(None)
+
+def merge_product_master(df, pm_indexed):
     """Merge combined data with purchase master"""
     pm_cols = ["ASIN", "Brand", "Brand Manager", "Vendor SKU Codes", "CP"]
-    pm_clean = pm_df[pm_cols].drop_duplicates(subset=["ASIN"]).copy()
-    
-    merged_df = df.merge(
-        pm_clean,
-        left_on="Asin",
-        right_on="ASIN",
-        how="left",
-        copy=False
-    )
+    merged_df = df.join(pm_indexed[pm_cols], on="Asin", how="left")
     
     merged_df["CP"] = pd.to_numeric(merged_df["CP"], errors="coerce")
     merged_df["Quantity"] = pd.to_numeric(merged_df["Quantity"], errors="coerce")
@@ -199,23 +398,67 @@ def merge_product_master(df, pm_df):
     
     return merged_df
 
+def _return_totals_numpy(fba, seller_flex, quantity):
+    total = fba + seller_flex
+    # Zero quantities give inf/NaN quietly, as the pandas division did
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return total, total / quantity * 100
+
+if HAS_NUMBA:
+    @njit(error_model="numpy")
+    def _return_totals_numba(fba, seller_flex, quantity):
+        """Total Return and the unrounded Return In % in one fused pass."""
+        n = fba.size
+        total = np.empty(n, np.float64)
+        pct = np.empty(n, np.float64)
+        for i in range(n):
+            t = fba[i] + seller_flex[i]
+            total[i] = t
+            pct[i] = t / quantity[i] * 100
+        return total, pct
+
+def return_totals(fba, seller_flex, quantity):
+    """Total Return and the unrounded Return In %, with numba on large inputs."""
+    if HAS_NUMBA and fba.size >= NUMBA_MIN_ROWS:
+        return _return_totals_numba(fba, seller_flex, quantity)
+    return _return_totals_numpy(fba, seller_flex, quantity)
+
+def add_return_totals(result):
+    """Set Total Return and Return In % from the FBA/Seller Flex return columns."""
+    fba = result["FBA Return"]
+    seller_flex = result["Seller Flex"]
+    total, pct = return_totals(
+        fba.to_numpy(np.float64, na_value=0.0),
+        seller_flex.to_numpy(np.float64, na_value=0.0),
+        result["Quantity"].to_numpy(np.float64, na_value=np.nan)
+    )
+    # Counts that were integers on both sides stay integers, as with fillna + add
+    if fba.dtype.kind in 'iu' and seller_flex.dtype.kind in 'iu':
+        total = total.astype(np.int64)
+    result["Total Return"] = total
+    result["Return In %"] = np.round(pct, 2)
+
+def sum_by(df, key, value):
+    """Sum `value` per `key` with a direct hash aggregation, largest first.
+
+    Group keys stay sorted so ties keep the alphabetical order pivot_table gave.
+    """
+    return (
+        df.groupby(key, observed=True)[value]
+        .sum()
+        .sort_values(ascending=False, kind="stable")
+        .reset_index()
+    )
+
 def create_brand_pivot(df):
     """Create brand-level pivot table"""
-    return df.pivot_table(
-        index="Brand",
-        values="Quantity",
-        aggfunc="sum"
-    ).reset_index().sort_values("Quantity", ascending=False)
+    return sum_by(df, "Brand", "Quantity")
 
 def create_asin_pivot(df):
     """Create ASIN-level pivot table"""
-    return df.pivot_table(
-        index="Asin",
-        values="Quantity",
-        aggfunc="sum"
-    ).reset_index().sort_values("Quantity", ascending=False)
+    return sum_by(df, "Asin", "Quantity")
 
-def create_asin_final_summary(asin_qty_pivot, fba_return_asin, seller_flex_asin, pm_df=None, fba_disposition_pivot=None):
+def create_asin_final_summary(asin_qty_pivot, fba_return_asin, seller_flex_asin, pm_indexed=None, fba_disposition_pivot=None):
     """Create final ASIN summary with returns and product details from PM file"""
     if fba_return_asin is not None:
         fba_return_asin = fba_return_asin.rename(columns={"quantity": "FBA Return", "asin": "Asin"})
@@ -223,23 +466,19 @@ def create_asin_final_summary(asin_qty_pivot, fba_return_asin, seller_flex_asin,
     if seller_flex_asin is not None:
         seller_flex_asin = seller_flex_asin.rename(columns={"Units": "Seller Flex", "ASIN": "Asin"})
     
-    result = asin_qty_pivot.copy()
+    result = asin_qty_pivot
     
     # Merge Brand, Product Name, and Vendor SKU Codes from PM file
-    if pm_df is not None:
-        pm_cols = ["ASIN", "Brand", "Product Name", "Vendor SKU Codes"]
-        available_cols = [col for col in pm_cols if col in pm_df.columns]
-        if available_cols:
-            pm_clean = pm_df[available_cols].drop_duplicates(subset=["ASIN"]).copy()
-            result = result.merge(pm_clean, left_on="Asin", right_on="ASIN", how="left")
-            if "ASIN" in result.columns:
-                result = result.drop(columns=["ASIN"])
+    if pm_indexed is not None:
+        pm_cols = ["Brand", "Product Name", "Vendor SKU Codes"]
+        available_cols = [col for col in pm_cols if col in pm_indexed.columns]
+        result = result.join(pm_indexed[available_cols], on="Asin", how="left")
     
     # Merge FBA returns
     if fba_return_asin is not None:
         result = result.merge(fba_return_asin[["Asin", "FBA Return"]], on="Asin", how="left")
     else:
-        result["FBA Return"] = 0
+        result = result.assign(**{"FBA Return": 0})
     
     # Merge Seller Flex returns
     if seller_flex_asin is not None:
@@ -248,13 +487,12 @@ def create_asin_final_summary(asin_qty_pivot, fba_return_asin, seller_flex_asin,
         result["Seller Flex"] = 0
     
     # Calculate total returns
-    result["Total Return"] = result["FBA Return"].fillna(0) + result["Seller Flex"].fillna(0)
-    result["Return In %"] = ((result["Total Return"] / result["Quantity"]) * 100).round(2)
+    add_return_totals(result)
     
     # Merge FBA Disposition columns
     disposition_cols = []
     if fba_disposition_pivot is not None:
-        disp_df = fba_disposition_pivot.copy()
+        disp_df = fba_disposition_pivot
         if "asin" in disp_df.columns:
             disp_df = disp_df.rename(columns={"asin": "Asin"})
         
@@ -276,45 +514,41 @@ def create_asin_final_summary(asin_qty_pivot, fba_return_asin, seller_flex_asin,
     if disposition_cols:
         existing_cols = existing_cols + disposition_cols + ["Disposition Total"]
     other_cols = [col for col in result.columns if col not in existing_cols]
-    result = result[existing_cols + other_cols]
-    
-    return result.sort_values("Quantity", ascending=False)
+    # Left joins keep the pivot's row order, which sum_by already sorted by Quantity
+    return result[existing_cols + other_cols]
 
-def process_seller_flex(df, pm_df):
+def process_seller_flex(df, pm_indexed):
     """Process Seller Flex data"""
     cols_to_remove = [
         "External ID1", "External ID2", "External ID3",
         "Forward Leg Tracking ID", "Reverse Leg Tracking ID", "RMA ID",
         "Return Status", "Carrier", "Pick -up date", "Last Updated On",
         "Returned with OTP", "Days In-transit", "Days Since Return Complete",
-        "Return Reason"
+        "Return Reason", "Return Type"
     ]
-    df = df.drop(columns=cols_to_remove, errors="ignore")
-    
-    df["Combine"] = df["Customer Order ID"].astype(str).str.strip() + df["ASIN"].astype(str).str.strip()
-    df = df.drop_duplicates(subset=["Combine"], keep='first')
-    
-    pm_cols = ["ASIN", "Brand", "Brand Manager", "Vendor SKU Codes", "CP"]
-    pm_clean = pm_df[pm_cols].drop_duplicates(subset=["ASIN"]).copy()
+    removed = set(cols_to_remove)
+    keep_cols = [c for c in df.columns if c not in removed]
     
-    df = df.merge(pm_clean, left_on="ASIN", right_on="ASIN", how="left", copy=False)
+    # Dedup on the (order, ASIN) pair directly; the Combine label is only
+    # concatenated for the rows that survive. Rows and columns are selected
+    # together in one projection.
+    order_ids = df["Customer Order ID"].astype(str).str.strip()
+    asins = df["ASIN"].astype(str).str.strip()
+    keep = ~pd.DataFrame({"order": order_ids, "asin": asins}).duplicated(keep='first')
+    df = df.loc[keep, keep_cols].assign(Combine=order_ids[keep] + asins[keep])
     
-    cols_to_drop = ["Return Type"]
-    df = df.drop(columns=[c for c in cols_to_drop if c in df.columns], errors="ignore")
+    # Only columns are added, so gather each one from the ASIN index
+    pm_cols = ["Brand", "Brand Manager", "Vendor SKU Codes", "CP"]
+    df = df.assign(**{col: df["ASIN"].map(pm_indexed[col]) for col in pm_cols})
     
     return df
 
-def process_fba_return(df, pm_df):
+def process_fba_return(df, pm_indexed):
     """Process FBA Return data"""
+    # Only columns are added, so gather each one from the ASIN index
     pm_cols = ["ASIN", "Brand", "Brand Manager", "Vendor SKU Codes", "CP"]
-    pm_clean = pm_df[pm_cols].drop_duplicates(subset=["ASIN"]).copy()
-    
-    df = df.merge(pm_clean, left_on="asin", right_on="ASIN", how="left", copy=False)
-    
-    if "Return Type" in df.columns:
-        df = df.drop(columns=["Return Type"])
-    
-    return df
+    keep_cols = [c for c in df.columns if c != "Return Type"]
+    return df[keep_cols].assign(**{col: df["asin"].map(pm_indexed[col]) for col in pm_cols})
 
 def create_final_summary(brand_qty_pivot, brand_fba_pivot, brand_seller_pivot, fba_disposition_brand_pivot=None):
     """Create final brand summary with returns"""
@@ -324,8 +558,7 @@ def create_final_summary(brand_qty_pivot, brand_fba_pivot, brand_seller_pivot, f
     result = brand_qty_pivot.merge(brand_fba_pivot[["Brand", "FBA Return"]], on="Brand", how="left")
     result = result.merge(brand_seller_pivot[["Brand", "Seller Flex"]], on="Brand", how="left")
     
-    result["Total Return"] = result["FBA Return"].fillna(0) + result["Seller Flex"].fillna(0)
-    result["Return In %"] = ((result["Total Return"] / result["Quantity"]) * 100).round(2)
+    add_return_totals(result)
 
     disposition_cols = []
     if fba_disposition_brand_pivot is not None:
@@ -338,7 +571,7 @@ def create_final_summary(brand_qty_pivot, brand_fba_pivot, brand_seller_pivot, f
         
         valid_disp_cols = [col for col in disposition_cols if col in result.columns]
         if valid_disp_cols:
-            result["Disposition Total"] = result[valid_disp_cols].sum(axis=1)
+            result["Disposition Total"] = result[valid_disp_cols].to_numpy().sum(axis=1)
 
     return result
 
@@ -347,13 +580,29 @@ def convert_df_to_excel(df):
     """Convert dataframe to excel bytes. Cached to prevent re-generation."""
     output = io.BytesIO()
     try:
-        with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}}) as writer:
+        with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {
+            # No constant_memory: pandas writes cells column by column, and that
+            # mode silently drops every cell not in the current row
+            'strings_to_urls': False,
+            'strings_to_formulas': False
+        }}) as writer:
             df.to_excel(writer, index=False, sheet_name='Sheet1')
     except Exception:
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             df.to_excel(writer, index=False, sheet_name='Sheet1')
     return output.getvalue()
 
+def convert_dfs_to_workbook(items):
+    """Write (sheet name, dataframe) pairs as the sheets of a single workbook."""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': {
+        'strings_to_urls': False,
+        'strings_to_formulas': False
+    }}) as writer:
+        for name, df in items:
+            df.to_excel(writer, index=False, sheet_name=name[:31])
+    return output.getvalue()
+
 @st.cache_data(show_spinner=False)
 def convert_df_to_csv(df):
     """Convert dataframe to CSV - faster and lighter for raw data. Cached."""
@@ -364,14 +613,28 @@ def create_download_button(df, filename, button_text="📥 Download Excel", is_c
     if df is None:
         return
 
-    return download_module_report(
+    report_name = filename.replace('.xlsx', '').replace('.csv', '').replace('_', ' ').title()
+    clicked = download_module_report(
         df=df,
         module_name=MODULE_NAME,
-        report_name=filename.replace('.xlsx', '').replace('.csv', '').replace('_', ' ').title(),
+        report_name=report_name,
         button_label=button_text,
         key=f"dl_{filename.replace('.', '_')}",
         tool_name=TOOL_NAME
     )
+    
+    # XLSX is slow and bulky for very large frames; offer Parquet alongside it
+    if len(df) > PARQUET_ROW_THRESHOLD:
+        clicked = download_module_report(
+            df=df,
+            module_name=MODULE_NAME,
+            report_name=report_name,
+            button_label="📥 Download Parquet",
+            key=f"dl_{filename.replace('.', '_')}_parquet",
+            tool_name=TOOL_NAME,
+            file_format="parquet"
+        ) or clicked
+    return clicked
 
 
 # Main App
@@ -385,6 +648,9 @@ if 'processed' not in st.session_state:
 if 'zip_data' not in st.session_state:
     st.session_state.zip_data = None
 
+if 'workbook_data' not in st.session_state:
+    st.session_state.workbook_data = None
+
 # File Upload Section
 col1, col2 = st.columns(2)
 
@@ -434,18 +700,16 @@ process_button = st.button("🚀 Process Data", use_container_width=True, type="
 if process_button:
     # Reset lazy download states when reprocessing
     st.session_state.zip_data = None
+    st.session_state.workbook_data = None
     
     if not (b2b_files or b2c_files):
         st.error("Please upload at least one B2B or B2C report file.")
     else:
         with st.spinner("Processing your data..."):
             try:
-                # Cleanup old temp file if it exists
-                if 'results' in st.session_state and 'raw_csv_path' in st.session_state.results:
-                    old_path = st.session_state.results.get('raw_csv_path')
-                    if old_path and os.path.exists(old_path):
-                        try: os.remove(old_path)
-                        except: pass
+                # Cleanup old temp files if they exist
+                if st.session_state.get('results'):
+                    remove_temp_results(st.session_state.results)
 
                 # Combine zip files to disk
                 progress_text = st.empty()
@@ -481,9 +745,10 @@ if process_button:
                     # Load product master
                     if product_master_file:
                         progress_text.text("📂 Loading Purchase Master...")
-                        pm_df = pd.read_excel(product_master_file)
+                        pm_df = read_product_master_bytes(product_master_file.getvalue())
+                        pm_indexed = index_product_master(pm_df)
                         progress_text.text("🔗 Merging Purchase details...")
-                        combined_df = merge_product_master(combined_df, pm_df)
+                        combined_df = merge_product_master(combined_df, pm_indexed)
                         
                     # Create pivots
                     progress_text.text("📊 Creating analysis pivots...")
@@ -497,17 +762,12 @@ if process_button:
                     
                     if seller_flex_file and product_master_file:
                         progress_text.text("📦 Processing Seller Flex data...")
-                        seller_flex_df = pd.read_csv(seller_flex_file)
-                        seller_flex_df = process_seller_flex(seller_flex_df, pm_df)
+                        seller_flex_df = read_csv_bytes(seller_flex_file.getvalue())
+                        seller_flex_df = process_seller_flex(seller_flex_df, pm_indexed)
                         seller_flex_df = ensure_arrow_compatibility(seller_flex_df)
                         
-                        seller_flex_brand = seller_flex_df.pivot_table(
-                            index="Brand", values="Units", aggfunc="sum"
-                        ).reset_index().sort_values("Units", ascending=False)
-                        
-                        seller_flex_asin = seller_flex_df.pivot_table(
-                            index="ASIN", values="Units", aggfunc="sum"
-                        ).reset_index().sort_values("Units", ascending=False)
+                        seller_flex_brand = sum_by(seller_flex_df, "Brand", "Units")
+                        seller_flex_asin = sum_by(seller_flex_df, "ASIN", "Units")
                     
                     # Process FBA Return
                     fba_return_df = None
@@ -517,26 +777,23 @@ if process_button:
                     fba_disposition_brand_pivot = None
                     
                     if fba_return_file and product_master_file:
-                        fba_return_df = pd.read_csv(fba_return_file)
-                        fba_return_df = process_fba_return(fba_return_df, pm_df)
+                        fba_return_df = read_csv_bytes(fba_return_file.getvalue())
+                        fba_return_df = process_fba_return(fba_return_df, pm_indexed)
                         fba_return_df = ensure_arrow_compatibility(fba_return_df)
 
-                        fba_return_brand = fba_return_df.pivot_table(
-                            index="Brand", values="quantity", aggfunc="sum"
-                        ).reset_index().sort_values("quantity", ascending=False)
-                        
-                        fba_return_asin = fba_return_df.pivot_table(
-                            index="asin", values="quantity", aggfunc="sum"
-                        ).reset_index().sort_values("quantity", ascending=False)
+                        fba_return_brand = sum_by(fba_return_df, "Brand", "quantity")
+                        fba_return_asin = sum_by(fba_return_df, "asin", "quantity")
                         
                         # Create ASIN x Disposition pivot table
                         if "detailed-disposition" in fba_return_df.columns:
                             fba_disposition_pivot = fba_return_df.pivot_table(
                                 index="asin", columns="detailed-disposition",
-                                values="quantity", aggfunc="sum", fill_value=0
+                                values="quantity", aggfunc="sum", fill_value=0, observed=True
                             ).reset_index()
-                            fba_disposition_pivot["Total"] = fba_disposition_pivot.select_dtypes(include='number').sum(axis=1)
-                            fba_disposition_pivot = fba_disposition_pivot.sort_values("Total", ascending=False)
+                            disposition_cols = fba_disposition_pivot.columns.drop("asin")
+                            fba_disposition_pivot = fba_disposition_pivot.assign(
+                                Total=fba_disposition_pivot[disposition_cols].to_numpy().sum(axis=1)
+                            ).sort_values("Total", ascending=False, kind="stable")
                             
                             fba_disposition_brand_pivot = fba_return_df.pivot_table(
                                 index="Brand", columns="detailed-disposition",
@@ -550,15 +807,15 @@ if process_button:
                             brand_qty_pivot, fba_return_brand, seller_flex_brand, fba_disposition_brand_pivot
                         )
                     else:
-                        brand_final = brand_qty_pivot
+                        brand_final = brand_qty_pivot.copy()
                     
                     if fba_return_asin is not None or seller_flex_asin is not None:
                         asin_final = create_asin_final_summary(
                             asin_qty_pivot, fba_return_asin, seller_flex_asin,
-                            pm_df if product_master_file else None, fba_disposition_pivot
+                            pm_indexed if product_master_file else None, fba_disposition_pivot
                         )
                     else:
-                        asin_final = asin_qty_pivot
+                        asin_final = asin_qty_pivot.copy()
                     
                     # Calculate metrics before adding Grand Totals
                     total_records = len(combined_df)
@@ -566,22 +823,23 @@ if process_button:
                     total_asins = len(asin_qty_pivot)
                     total_sf_returns = len(seller_flex_df) if seller_flex_df is not None else 0
 
-                    # Add Grand Totals to all dataframes
-                    combined_df = add_grand_total(combined_df)
+                    # Row-level frames go to per-run temp files; the display
+                    # code appends their Grand Totals when loading
+                    combined_df = persist_frame(combined_df, "combined_df")
+                    seller_flex_df = persist_frame(seller_flex_df, "seller_flex_df")
+                    fba_return_df = persist_frame(fba_return_df, "fba_return_df")
+
+                    # Add Grand Totals to the summary dataframes
                     brand_qty_pivot = add_grand_total(brand_qty_pivot)
                     asin_qty_pivot = add_grand_total(asin_qty_pivot)
                     brand_final = add_grand_total(brand_final)
                     asin_final = add_grand_total(asin_final)
                     
-                    if seller_flex_df is not None:
-                        seller_flex_df = add_grand_total(seller_flex_df)
                     if seller_flex_brand is not None:
                         seller_flex_brand = add_grand_total(seller_flex_brand)
                     if seller_flex_asin is not None:
                         seller_flex_asin = add_grand_total(seller_flex_asin)
                     
-                    if fba_return_df is not None:
-                        fba_return_df = add_grand_total(fba_return_df)
                     if fba_return_brand is not None:
                         fba_return_brand = add_grand_total(fba_return_brand)
                     if fba_return_asin is not None:
@@ -630,23 +888,29 @@ if process_button:
                             tool_name=TOOL_NAME
                         )
                         
-                        # Also keep reconciliation specific dump but in 'amazon' collection
-                        save_reconciliation_report(
-                            collection_name=MODULE_NAME,
-                            invoice_no=f"SALESVSRETURN_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}",
-                            summary_data={
-                                "total_records": total_records,
-                                "raw_total_records": raw_total_records,
-                                "total_brands": total_brands,
-                                "total_asins": total_asins,
-                                "total_sf_returns": total_sf_returns
-                            },
-                            line_items_data=asin_final,
-                            metadata={
-                                "report_type": "sales_vs_return",
-                                "tool_name": TOOL_NAME
-                            }
-                        )
+                        # Also keep reconciliation specific dump but in 'amazon' collection.
+                        # The insert (and the line-item to_dict) is pure I/O with nothing
+                        # rendered from it, so it runs off the script thread.
+                        Thread(
+                            target=save_reconciliation_report,
+                            kwargs=dict(
+                                collection_name=MODULE_NAME,
+                                invoice_no=f"SALESVSRETURN_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}",
+                                summary_data={
+                                    "total_records": total_records,
+                                    "raw_total_records": raw_total_records,
+                                    "total_brands": total_brands,
+                                    "total_asins": total_asins,
+                                    "total_sf_returns": total_sf_returns
+                                },
+                                line_items_data=asin_final,
+                                metadata={
+                                    "report_type": "sales_vs_return",
+                                    "tool_name": TOOL_NAME
+                                }
+                            ),
+                            daemon=True
+                        ).start()
                     except Exception as e:
                         pass
                     
@@ -663,6 +927,8 @@ if st.session_state.processed:
         st.markdown("## 📊 Analysis Results")
         
         results = st.session_state.results
+        # The in-memory report frames, picked out once for the tabs and the ZIP
+        report_dfs = {name: v for name, v in results.items() if isinstance(v, pd.DataFrame)}
         
         # Metrics
         col1, col2, col3, col4 = st.columns(4)
@@ -709,75 +975,87 @@ if st.session_state.processed:
 
         with tab1:
             st.subheader("Filtered Transaction Data (Shipments Only)")
-            st.dataframe(results['combined_df'].head(100), use_container_width=True)
-            create_download_button(results['combined_df'], "filtered_shipment_report.xlsx", "📥 Download Filtered Excel")
-            create_download_button(results['combined_df'], "filtered_shipment_report.csv", "📥 Download Filtered CSV", is_csv=True)
+            combined_df = load_frame(results['combined_df'])
+            st.dataframe(paged_view(combined_df, "svr_filtered"), use_container_width=True)
+            create_download_button(combined_df, "filtered_shipment_report.xlsx", "📥 Download Filtered Excel")
+            create_download_button(combined_df, "filtered_shipment_report.csv", "📥 Download Filtered CSV", is_csv=True)
         
         with tab2:
             col1, col2 = st.columns(2)
             with col1:
                 st.subheader("Brand Quantity Pivot")
-                st.dataframe(results['brand_qty_pivot'], use_container_width=True)
-                create_download_button(results['brand_qty_pivot'], "brand_quantity_pivot.xlsx")
+                brand_qty_pivot = report_dfs.get('brand_qty_pivot')
+                st.dataframe(brand_qty_pivot, use_container_width=True)
+                create_download_button(brand_qty_pivot, "brand_quantity_pivot.xlsx")
             
             with col2:
                 st.subheader("Brand Final Summary (with Returns)")
-                st.dataframe(results['brand_final'], use_container_width=True)
-                create_download_button(results['brand_final'], "brand_final_summary.xlsx")
+                brand_final = report_dfs.get('brand_final')
+                st.dataframe(brand_final, use_container_width=True)
+                create_download_button(brand_final, "brand_final_summary.xlsx")
         
         with tab3:
             col1, col2 = st.columns(2)
             with col1:
                 st.subheader("ASIN Quantity Pivot")
-                st.dataframe(results['asin_qty_pivot'], use_container_width=True)
-                create_download_button(results['asin_qty_pivot'], "asin_quantity_pivot.xlsx")
+                asin_qty_pivot = report_dfs.get('asin_qty_pivot')
+                st.dataframe(asin_qty_pivot, use_container_width=True)
+                create_download_button(asin_qty_pivot, "asin_quantity_pivot.xlsx")
             
             with col2:
-                if 'asin_final' in results and results['asin_final'] is not None:
+                asin_final = report_dfs.get('asin_final')
+                if asin_final is not None:
                     st.subheader("ASIN Final Summary (with Returns)")
-                    st.dataframe(results['asin_final'], use_container_width=True)
-                    create_download_button(results['asin_final'], "asin_final_summary.xlsx")
+                    st.dataframe(asin_final, use_container_width=True)
+                    create_download_button(asin_final, "asin_final_summary.xlsx")
         
         with tab4:
             if results['seller_flex_df'] is not None:
                 st.subheader("Raw Seller Flex Data")
-                st.dataframe(results['seller_flex_df'].head(100), use_container_width=True)
-                create_download_button(results['seller_flex_df'], "seller_flex_raw_data.xlsx")
+                seller_flex_df = load_frame(results['seller_flex_df'])
+                st.dataframe(paged_view(seller_flex_df, "svr_seller_flex"), use_container_width=True)
+                create_download_button(seller_flex_df, "seller_flex_raw_data.xlsx")
                 
                 col1, col2 = st.columns(2)
                 with col1:
                     st.subheader("Seller Flex - Brand Pivot")
-                    st.dataframe(results['seller_flex_brand'], use_container_width=True)
-                    create_download_button(results['seller_flex_brand'], "seller_flex_brand.xlsx")
+                    seller_flex_brand = report_dfs.get('seller_flex_brand')
+                    st.dataframe(seller_flex_brand, use_container_width=True)
+                    create_download_button(seller_flex_brand, "seller_flex_brand.xlsx")
                 
                 with col2:
                     st.subheader("Seller Flex - ASIN Pivot")
-                    st.dataframe(results['seller_flex_asin'], use_container_width=True)
-                    create_download_button(results['seller_flex_asin'], "seller_flex_asin.xlsx")
+                    seller_flex_asin = report_dfs.get('seller_flex_asin')
+                    st.dataframe(seller_flex_asin, use_container_width=True)
+                    create_download_button(seller_flex_asin, "seller_flex_asin.xlsx")
             else:
                 st.info("No Seller Flex data uploaded")
         
         with tab5:
             if results['fba_return_df'] is not None:
                 st.subheader("Raw FBA Return Data")
-                st.dataframe(results['fba_return_df'].head(100), use_container_width=True)
-                create_download_button(results['fba_return_df'], "fba_return_raw_data.xlsx")
+                fba_return_df = load_frame(results['fba_return_df'])
+                st.dataframe(paged_view(fba_return_df, "svr_fba_return"), use_container_width=True)
+                create_download_button(fba_return_df, "fba_return_raw_data.xlsx")
 
                 col1, col2 = st.columns(2)
                 with col1:
                     st.subheader("FBA Return - Brand Pivot")
-                    st.dataframe(results['fba_return_brand'], use_container_width=True)
-                    create_download_button(results['fba_return_brand'], "fba_return_brand.xlsx")
+                    fba_return_brand = report_dfs.get('fba_return_brand')
+                    st.dataframe(fba_return_brand, use_container_width=True)
+                    create_download_button(fba_return_brand, "fba_return_brand.xlsx")
                 
                 with col2:
                     st.subheader("FBA Return - ASIN Pivot")
-                    st.dataframe(results['fba_return_asin'], use_container_width=True)
-                    create_download_button(results['fba_return_asin'], "fba_return_asin.xlsx")
+                    fba_return_asin = report_dfs.get('fba_return_asin')
+                    st.dataframe(fba_return_asin, use_container_width=True)
+                    create_download_button(fba_return_asin, "fba_return_asin.xlsx")
                 
-                if results.get('fba_disposition_pivot') is not None:
+                fba_disposition_pivot = report_dfs.get('fba_disposition_pivot')
+                if fba_disposition_pivot is not None:
                     st.subheader("FBA Return - ASIN x Disposition Pivot")
-                    st.dataframe(results['fba_disposition_pivot'], use_container_width=True)
-                    create_download_button(results['fba_disposition_pivot'], "fba_disposition_pivot.xlsx")
+                    st.dataframe(fba_disposition_pivot, use_container_width=True)
+                    create_download_button(fba_disposition_pivot, "fba_disposition_pivot.xlsx")
             else:
                 st.info("No FBA Return data uploaded")
         
@@ -785,30 +1063,45 @@ if st.session_state.processed:
         st.markdown("---")
         st.subheader("📥 Download All Reports")
         
+        # Default: every analysis report as a sheet of one workbook
+        if st.button("🛠️ Generate Reports Workbook (Analysis Only)", use_container_width=True, key="gen_workbook"):
+            with st.spinner("Creating workbook..."):
+                items = [(name, report_dfs[key]) for name, key in ZIP_REPORTS if key in report_dfs]
+                st.session_state.workbook_data = convert_dfs_to_workbook(items)
+        
+        if st.session_state.workbook_data is not None:
+            st.download_button(
+                label="📊 Download Analysis Workbook",
+                data=st.session_state.workbook_data,
+                file_name=get_download_filename("amazon_analysis_reports", "xlsx"),
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True,
+                key="dl_workbook"
+            )
+        
+        # Alternative: one file per report plus the raw CSV
         if st.button("🛠️ Generate Reports ZIP (Analysis Only)", use_container_width=True, key="gen_zip"):
             with st.spinner("Creating ZIP file..."):
-                zip_buffer = io.BytesIO()
-                with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    essential_dfs = {
-                        'brand_final': results.get('brand_final'),
-                        'asin_final': results.get('asin_final'),
-                        'brand_qty_pivot': results.get('brand_qty_pivot'),
-                        'asin_qty_pivot': results.get('asin_qty_pivot'),
-                        'seller_flex_brand': results.get('seller_flex_brand'),
-                        'seller_flex_asin': results.get('seller_flex_asin'),
-                        'fba_return_brand': results.get('fba_return_brand'),
-                        'fba_return_asin': results.get('fba_return_asin'),
-                        'fba_disposition': results.get('fba_disposition_pivot')
-                    }
-                    
-                    for name, df in essential_dfs.items():
-                        if df is not None:
-                            zip_file.writestr(f"{name}.xlsx", convert_df_to_excel(df))
-                    
-                    if 'raw_csv_path' in results and os.path.exists(results['raw_csv_path']):
-                        zip_file.write(results['raw_csv_path'], arcname="raw_combined_unfiltered_report.csv")
+                items = [(name, report_dfs[key]) for name, key in ZIP_REPORTS if key in report_dfs]
                 
-                st.session_state.zip_data = zip_buffer.getvalue()
+                # Encode the workbooks side by side; the deflate step inside
+                # each xlsx releases the GIL
+                with ThreadPoolExecutor(max_workers=max(1, min(8, len(items)))) as pool:
+                    blobs = list(pool.map(lambda item: convert_df_to_excel(item[1]), items))
+                
+                # xlsx members are already deflated, so a light level costs little size.
+                # The archive is assembled on disk rather than in a second buffer.
+                with tempfile.TemporaryFile() as zip_tmp:
+                    with zipfile.ZipFile(zip_tmp, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as zip_file:
+                        for (name, _), blob in zip(items, blobs):
+                            zip_file.writestr(f"{name}.xlsx", blob)
+                        
+                        if 'raw_csv_path' in results and os.path.exists(results['raw_csv_path']):
+                            zip_file.write(results['raw_csv_path'], arcname="raw_combined_unfiltered_report.csv")
+                    
+                    del blobs
+                    zip_tmp.seek(0)
+                    st.session_state.zip_data = zip_tmp.read()
                 gc.collect()
         
         if st.session_state.zip_data is not None:
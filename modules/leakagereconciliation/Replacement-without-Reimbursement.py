@@ -1,7 +1,11 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, date
 import io
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 from common.ui_utils import (
     apply_professional_style, 
     get_download_filename, 
@@ -9,8 +13,34 @@ from common.ui_utils import (
     download_module_report
 )
 
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
 MODULE_NAME = "leakagereconciliation"
 
+DAMAGED_STATUSES = ["CARRIER_DAMAGED", "CUSTOMER_DAMAGED"]
+REIMBURSEMENT_REASONS = ["CustomerReturn", "CustomerServiceIssue"]
+
+# The Full Data tab only previews this many rows; the full report is downloadable
+FULL_DATA_PREVIEW_ROWS = 500
+
+# Only these columns of the lookup files are ever read
+RETURN_COLUMNS = [1, 8]
+REFUND_COLUMNS = [4]
+BULK_RTO_COLUMNS = [0]
+REIMBURSEMENT_COLUMNS = ["amazon-order-id", "reason"]
+
+# Below this many rows the NumPy masks finish before numba could compile its kernel.
+# The kernel is not cached on disk: pages are exec'd under an unregistered module
+# name, and numba cannot reload a cached kernel from such a module
+NUMBA_MIN_ROWS = 1_000_000
+
+# Read as text like pandas did; inferred tz-aware timestamps cannot be written to Excel
+CSV_COLUMN_TYPES = {"shipment-date": pa.string()}
+
 st.set_page_config(page_title="Amazon Replacement Without Reimbursement Analyzer", page_icon="🔄", layout="wide")
 apply_professional_style()
 
@@ -37,161 +67,251 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def read_any_file(file, sheet_name=None):
+def read_csv_arrow(file, usecols=None):
+    """Parse a CSV with PyArrow's multithreaded reader into Arrow-backed columns.
+
+    `usecols` may mix names and header positions; only those columns are converted.
+    Falls back to pandas when a column's inferred type clashes later in the file.
+    """
+    convert_options = pa_csv.ConvertOptions(strings_can_be_null=True, column_types=CSV_COLUMN_TYPES)
+    try:
+        if usecols is not None:
+            header = pa_csv.open_csv(file).schema.names
+            file.seek(0)
+            convert_options.include_columns = [
+                header[col] if isinstance(col, int) else col for col in usecols
+            ]
+        table = pa_csv.read_csv(
+            file,
+            read_options=pa_csv.ReadOptions(use_threads=True),
+            convert_options=convert_options
+        )
+    except pa.ArrowInvalid:
+        file.seek(0)
+        return pd.read_csv(file, usecols=usecols)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+def read_any_file(file, sheet_name=None, usecols=None):
+    file.seek(0)
     if file.name.lower().endswith(".csv"):
-        return pd.read_csv(file)
+        return read_csv_arrow(file, usecols=usecols)
     else:
         if sheet_name:
-            return pd.read_excel(file, sheet_name=sheet_name)
-        return pd.read_excel(file)
-        
+            return pd.read_excel(file, sheet_name=sheet_name, usecols=usecols)
+        return pd.read_excel(file, usecols=usecols)
+
+def as_key(series):
+    """Store an order-id style join key as an Arrow-backed string column."""
+    return series.astype("string[pyarrow]")
+
+def category_lookup(series, values):
+    """Per-code flags marking which categories of `series` are in `values`.
+
+    Slot 0 stands for missing values (code -1), so index the result with codes + 1.
+    """
+    return np.concatenate([[False], series.cat.categories.isin(values)])
+
+def category_code_mask(series, values):
+    """OR together code-equality tests for a handful of category values."""
+    codes = series.cat.codes.to_numpy()
+    mask = np.zeros(codes.size, dtype=bool)
+    for value in values:
+        if value in series.cat.categories:
+            mask |= codes == series.cat.categories.get_loc(value)
+    return mask
+
+def na_like_lookup(series, strip=False):
+    """Per-code flags for null or literal "NA" (case-insensitive) categories.
+
+    Slot 0 stands for missing values (code -1), so index the result with codes + 1.
+    """
+    labels = series.cat.categories.astype(str)
+    if strip:
+        labels = labels.str.strip()
+    return np.concatenate([[True], labels.str.upper() == "NA"])
+
+def is_na_like(series, strip=False):
+    """Mask rows that are null or hold the literal text "NA" (case-insensitive).
+
+    The text test runs once per category instead of once per row.
+    """
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype("category")
+    return na_like_lookup(series, strip)[series.cat.codes.to_numpy(np.int32) + 1]
+
+def _build_masks_numpy(orig_codes, repl_codes, orig_damaged, repl_damaged, orig_na, repl_na,
+                       single_reimb, refund_pending, days, threshold):
+    recent = days >= threshold
+    damaged = orig_damaged[orig_codes + 1] & repl_damaged[repl_codes + 1] & single_reimb & recent
+    refund = orig_na[orig_codes + 1] & repl_na[repl_codes + 1] & refund_pending & recent
+    return damaged, refund
+
+if HAS_NUMBA:
+    @njit(parallel=True)
+    def _build_masks_numba(orig_codes, repl_codes, orig_damaged, repl_damaged, orig_na, repl_na,
+                           single_reimb, refund_pending, days, threshold):
+        """Evaluate the damaged and refund-without-return masks in one parallel pass."""
+        n = orig_codes.size
+        damaged = np.empty(n, np.bool_)
+        refund = np.empty(n, np.bool_)
+        for i in prange(n):
+            o = orig_codes[i] + 1
+            r = repl_codes[i] + 1
+            recent = days[i] >= threshold
+            damaged[i] = orig_damaged[o] and repl_damaged[r] and single_reimb[i] and recent
+            refund[i] = orig_na[o] and repl_na[r] and refund_pending[i] and recent
+        return damaged, refund
+
+def build_masks(orig_codes, *args):
+    """Evaluate the damaged and refund-without-return masks, with numba on large inputs."""
+    if HAS_NUMBA and orig_codes.size >= NUMBA_MIN_ROWS:
+        return _build_masks_numba(orig_codes, *args)
+    return _build_masks_numpy(orig_codes, *args)
+
+def format_for_display(df):
+    """Render the Date column as plain dates for the on-screen preview only."""
+    return df.assign(Date=df['Date'].dt.strftime('%Y-%m-%d'))
+
+@st.cache_data(show_spinner=False)
+def load_input_files(replace_file, return_file, refund_file, bulk_rto_file, reim_file):
+    """Parse the five uploads in parallel. Streamlit hashes uploaded files by content.
+
+    The pandas/PyArrow readers release the GIL while decoding, so threads overlap.
+    """
+    jobs = [
+        (replace_file, {}),
+        (return_file, {"usecols": RETURN_COLUMNS}),
+        (refund_file, {"sheet_name": 'Sheet1', "usecols": REFUND_COLUMNS}),
+        (bulk_rto_file, {"sheet_name": "All", "usecols": BULK_RTO_COLUMNS}),
+        (reim_file, {"sheet_name": 'Sheet1', "usecols": REIMBURSEMENT_COLUMNS})
+    ]
+    with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [executor.submit(read_any_file, file, **kwargs) for file, kwargs in jobs]
+        return tuple(future.result() for future in futures)
+
+@st.cache_data(show_spinner=False)
+def enrich_replacement_data(replace_file, return_file, refund_file, bulk_rto_file, reim_file):
+    """Run every lookup that does not depend on the days threshold."""
+    Replace, Return, Refund, BulkRTO, Reimbursement = load_input_files(
+        replace_file, return_file, refund_file, bulk_rto_file, reim_file
+    )
+    
+    # Resolve positional columns once; the lookups below append new columns.
+    # The lookup files were read with only the columns listed in *_COLUMNS.
+    replacement_order_col = Replace.columns[7]   # Column H
+    original_order_col = Replace.columns[8]      # Column I
+    return_key_col, return_status_col = Return.columns   # Columns B and I
+    reimb_order_col = "amazon-order-id"
+    refund_key_col = Refund.columns[0]           # Column E
+    bulk_key_col = BulkRTO.columns[0]            # Column A
+    
+    Replace[replacement_order_col] = as_key(Replace[replacement_order_col])
+    Replace[original_order_col] = as_key(Replace[original_order_col])
+    
+    # Convert date and calculate difference
+    shipment_dates = pd.to_datetime(Replace['shipment-date'], errors='coerce')
+    if shipment_dates.dt.tz is not None:
+        shipment_dates = shipment_dates.dt.tz_localize(None)
+    Replace['Date'] = shipment_dates.dt.normalize()
+    day_values = Replace['Date'].to_numpy().astype('datetime64[D]')
+    Replace['Date_Difference'] = (np.datetime64(date.today(), 'D') - day_values) / np.timedelta64(1, 'D')
+    
+    Return[return_key_col] = as_key(Return[return_key_col])
+    
+    # Index the Return lookup once so both joins take the index-join path
+    return_status = Return.set_index(return_key_col)[return_status_col]
+    
+    # FBA Original Return Lookup (Column I → Column B → Column 8)
+    Replace = Replace.merge(
+        return_status.rename("FBA Original Return"),
+        how="left",
+        left_on=original_order_col,
+        right_index=True,
+        sort=False
+    )
+    
+    # FBA Replacement Return Lookup (Column H → Column B → Column 8)
+    Replace = Replace.merge(
+        return_status.rename("FBA Replacement Return"),
+        how="left",
+        left_on=replacement_order_col,
+        right_index=True,
+        sort=False
+    ).reset_index(drop=True)
+    
+    # Return statuses are low-cardinality - store them as categories
+    Replace["FBA Original Return"] = Replace["FBA Original Return"].astype("category")
+    Replace["FBA Replacement Return"] = Replace["FBA Replacement Return"].astype("category")
+    
+    # Filter reimbursement data
+    reasons = Reimbursement["reason"].astype("category")
+    filtered_reimb = Reimbursement.loc[category_code_mask(reasons, REIMBURSEMENT_REASONS)]
+    
+    # CountIF: number of reimbursement rows per order id
+    reimb_counts = as_key(filtered_reimb[reimb_order_col]).value_counts()
+    original_orders = Replace[original_order_col]
+    count_if = original_orders.map(reimb_counts).fillna(0).astype("int16")
+    
+    # Refund Check Lookup (existence check only, no join needed)
+    refund_keys = pd.Index(as_key(Refund[refund_key_col]).dropna().unique())
+    Replace["Refund Check"] = original_orders.where(original_orders.isin(refund_keys))
+    
+    # Door Step Return Lookup (existence check only, no join needed)
+    bulk_keys = pd.Index(as_key(BulkRTO[bulk_key_col]).dropna().unique())
+    door_step = original_orders.where(original_orders.isin(bulk_keys))
+    
+    return {
+        'main': Replace,
+        'count_if': count_if,
+        'door_step': door_step
+    }
+
+@st.cache_data(show_spinner=False)
+def filter_replacement_data(enriched, days_threshold: int):
+    """Apply the threshold-dependent filters to the enriched replacement data."""
+    Replace = enriched['main']
+    count_if = enriched['count_if']
+    door_step = enriched['door_step']
+    orig_status = Replace["FBA Original Return"]
+    repl_status = Replace["FBA Replacement Return"]
+    
+    # Filter 1: Damaged Returns with CountIF = 1
+    # Filter 2: Refund without Returns, Filter 3: No Door Step Return
+    # Both also require Date_Difference >= days_threshold
+    refund_pending = ~is_na_like(Replace["Refund Check"]) & is_na_like(door_step, strip=True)
+    mask_damaged, mask_refund = build_masks(
+        orig_status.cat.codes.to_numpy(np.int32),
+        repl_status.cat.codes.to_numpy(np.int32),
+        category_lookup(orig_status, DAMAGED_STATUSES),
+        category_lookup(repl_status, DAMAGED_STATUSES),
+        na_like_lookup(orig_status),
+        na_like_lookup(repl_status),
+        (count_if == 1).to_numpy(),
+        refund_pending,
+        Replace["Date_Difference"].to_numpy(np.float64),
+        float(days_threshold)
+    )
+    
+    damaged_returns = Replace.loc[mask_damaged, Replace.columns.drop("Refund Check")].assign(
+        CountIF=count_if[mask_damaged]
+    )
+    refund_without_return = Replace.loc[mask_refund].assign(
+        **{"Door Step Return": door_step[mask_refund]}
+    )
+    
+    return {
+        'main': Replace,
+        'damaged_returns': damaged_returns,
+        'refund_without_return': refund_without_return,
+        'damaged_count': len(damaged_returns),
+        'refund_count': len(refund_without_return)
+    }
+
 def process_replacement_data(replace_file, return_file, refund_file, bulk_rto_file, reim_file, days_threshold: int):
     """Process replacement data with all lookups and filters"""
     try:
-        # Load Replace.csv
-        Replace = read_any_file(replace_file)
-        
-        # Convert date and calculate difference
-        Replace['Date'] = pd.to_datetime(Replace['shipment-date'], errors='coerce').dt.date
-        Replace['Today_Date'] = date.today()
-        Replace['Date_Difference'] = (pd.to_datetime(Replace['Today_Date']) - pd.to_datetime(Replace['Date'])).dt.days
-        
-        # Load Return.csv
-        Return = read_any_file(return_file)
-        
-        # FBA Original Return Lookup (Column I → Column B → Column 8)
-        lookup_value_col = Replace.columns[8]
-        lookup_key_col = Return.columns[1]
-        return_value_col = Return.columns[8]
-        
-        Replace = Replace.merge(
-            Return[[lookup_key_col, return_value_col]],
-            how="left",
-            left_on=lookup_value_col,
-            right_on=lookup_key_col
-        )
-        Replace.rename(columns={return_value_col: "FBA Original Return"}, inplace=True)
-        Replace.drop(columns=[lookup_key_col], inplace=True, errors="ignore")
-        
-        # FBA Replacement Return Lookup (Column H → Column B → Column 8)
-        lookup_value_col = Replace.columns[7]
-        lookup_key_col = Return.columns[1]
-        return_value_col = Return.columns[8]
-        
-        Replace = Replace.merge(
-            Return[[lookup_key_col, return_value_col]],
-            how="left",
-            left_on=lookup_value_col,
-            right_on=lookup_key_col
-        )
-        Replace.rename(columns={return_value_col: "FBA Replacement Return"}, inplace=True)
-        Replace.drop(columns=[lookup_key_col], inplace=True, errors="ignore")
-        
-        # Filter 1: Damaged Returns
-        filtered_df = Replace[
-            (
-                Replace["FBA Original Return"].isin(["CARRIER_DAMAGED", "CUSTOMER_DAMAGED"]) &
-                Replace["FBA Replacement Return"].isin(["CARRIER_DAMAGED", "CUSTOMER_DAMAGED"])
-            )
-        ].copy()
-        
-        # Load Reimbursement
-        Reimbursement =read_any_file(reim_file, sheet_name='Sheet1')
-        
-        # Filter reimbursement data
-        filtered_reimb = Reimbursement[
-            Reimbursement["reason"].isin(["CustomerReturn", "CustomerServiceIssue"])
-        ].copy()
-        
-        # Add CountIF
-        filtered_reimb.loc[:, "CountIF"] = (
-            filtered_reimb.groupby("amazon-order-id")["amazon-order-id"].transform("count")
-        )
-        
-        # Merge CountIF into filtered_df
-        lookup_value_col = filtered_df.columns[8]
-        lookup_key_col = filtered_reimb.columns[3]
-        return_value_col = filtered_reimb.columns[18]
-        
-        filtered_df = filtered_df.merge(
-            filtered_reimb[[lookup_key_col, return_value_col]],
-            how="left",
-            left_on=lookup_value_col,
-            right_on=lookup_key_col
-        )
-        filtered_df.rename(columns={return_value_col: "CountIF"}, inplace=True)
-        filtered_df.drop(columns=[lookup_key_col], inplace=True, errors="ignore")
-        
-        # 🔍 Filter: CountIF = 1 and Date_Difference >= days_threshold
-        filtered_df_final = filtered_df[
-            (filtered_df["CountIF"] == 1.0) &
-            (filtered_df["Date_Difference"] >= days_threshold)
-        ].copy()
-        
-        # Load Refund Only file
-        Refund = read_any_file(refund_file, sheet_name='Sheet1')
-        
-        # Refund Check Lookup
-        lookup_value_col = Replace.columns[8]
-        lookup_key_col = Refund.columns[4]
-        
-        Replace = Replace.merge(
-            Refund[[lookup_key_col]].drop_duplicates(),
-            how="left",
-            left_on=lookup_value_col,
-            right_on=lookup_key_col
-        )
-        Replace["Refund Check"] = Replace[lookup_key_col]
-        Replace.drop(columns=[lookup_key_col], inplace=True, errors="ignore")
-        
-        # Filter 2: Refund without Returns
-        filtered_df_step2 = Replace[
-            (
-                (Replace["FBA Original Return"].isna()) |
-                (Replace["FBA Original Return"].astype(str).str.upper().eq("NA"))
-            ) &
-            (
-                (Replace["FBA Replacement Return"].isna()) |
-                (Replace["FBA Replacement Return"].astype(str).str.upper().eq("NA"))
-            ) &
-            (
-                (~Replace["Refund Check"].astype(str).str.upper().eq("NA")) &
-                (~Replace["Refund Check"].isna())
-            ) &
-            (
-                (Replace["Date_Difference"] >= days_threshold)
-            )
-        ].copy()
-        
-        # Load Bulk RTO
-        BulkRTO = read_any_file(bulk_rto_file, sheet_name="All")
-        
-        # Door Step Return Lookup
-        lookup_value_col = filtered_df_step2.columns[8]
-        lookup_key_col = BulkRTO.columns[0]
-        
-        filtered_df_step2 = filtered_df_step2.merge(
-            BulkRTO[[lookup_key_col]].drop_duplicates(),
-            how="left",
-            left_on=lookup_value_col,
-            right_on=lookup_key_col
-        )
-        filtered_df_step2["Door Step Return"] = filtered_df_step2[lookup_key_col]
-        filtered_df_step2.drop(columns=[lookup_key_col], inplace=True, errors="ignore")
-        
-        # Filter 3: No Door Step Return
-        filtered_df_step3 = filtered_df_step2[
-            (filtered_df_step2["Door Step Return"].isna()) |
-            (filtered_df_step2["Door Step Return"].astype(str).str.strip().str.upper().eq("NA"))
-        ].copy()
-        
-        return {
-            'main': Replace,
-            'damaged_returns': filtered_df_final,
-            'refund_without_return': filtered_df_step3,
-            'damaged_count': len(filtered_df_final),
-            'refund_count': len(filtered_df_step3)
-        }
+        enriched = enrich_replacement_data(replace_file, return_file, refund_file, bulk_rto_file, reim_file)
+        return filter_replacement_data(enriched, days_threshold)
         
     except Exception as e:
         st.error(f"Error processing files: {str(e)}")
@@ -264,15 +384,23 @@ if all(all_files):
                 
                 with tab1:
                     st.markdown(f"**Replacements with damaged items (≥{int(days_threshold)} days old)**")
-                    st.dataframe(results['damaged_returns'], use_container_width=True)
+                    st.dataframe(format_for_display(results['damaged_returns']), use_container_width=True)
                 
                 with tab2:
                     st.markdown(f"**Replacements with refund but no return record (≥{int(days_threshold)} days old)**")
-                    st.dataframe(results['refund_without_return'], use_container_width=True)
+                    st.dataframe(format_for_display(results['refund_without_return']), use_container_width=True)
                 
                 with tab3:
                     st.markdown("**All processed replacement data**")
-                    st.dataframe(results['main'], use_container_width=True)
+                    st.dataframe(
+                        format_for_display(results['main'].head(FULL_DATA_PREVIEW_ROWS)).reset_index(drop=True),
+                        use_container_width=True
+                    )
+                    if len(results['main']) > FULL_DATA_PREVIEW_ROWS:
+                        st.caption(
+                            f"Showing the first {FULL_DATA_PREVIEW_ROWS:,} of {len(results['main']):,} rows. "
+                            "Use Download Full Report below for the complete data."
+                        )
                 
                 # Download Buttons - Each report saved to MongoDB individually when downloaded
                 st.markdown("### 💾 Download Reports")
@@ -305,6 +433,14 @@ if all(all_files):
                         button_label="⬇️ Download Full Report",
                         key="replacement_full"
                     )
+                    download_module_report(
+                        df=results['main'],
+                        module_name=MODULE_NAME,
+                        report_name="Full Replacement Report",
+                        button_label="⬇️ Download Full Report (Parquet)",
+                        key="replacement_full_parquet",
+                        file_format="parquet"
+                    )
 else:
     st.info("👆 Please upload all required files to begin analysis")
 
@@ -2,12 +2,17 @@ import streamlit as st
 import pandas as pd
 import zipfile
 import io
+from threading import Thread
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv as pa_csv
 from datetime import datetime
 from common.ui_utils import (
     apply_professional_style, 
     get_download_filename, 
     render_header,
-    download_module_report
+    download_module_report,
+    paged_view
 )
 
 MODULE_NAME = "leakagereconciliation"
@@ -70,113 +75,193 @@ st.markdown("""
 # ==============================
 # Helpers
 # ==============================
-def normalize_sku(val):
-    if pd.isna(val):
-        return None
-    val = str(val).strip()
-    if val.endswith(".0"):
-        val = val[:-2]
-    return val
+def normalize_sku(series):
+    """Strip SKUs/order ids and drop a trailing ".0" left by float parsing.
+
+    Works on the whole column at once; missing values stay None.
+    """
+    missing = series.isna()
+    out = series.astype(str).str.strip().str.removesuffix(".0")
+    return out.astype(object).where(~missing, None)
 
 def make_arrow_safe(df):
-    df = df.copy().reset_index(drop=True)
-    for col in df.columns:
-        df[col] = df[col].astype(str)
-    return df
+    """Convert a frame to the Arrow table st.dataframe renders, without stringifying it.
+
+    Only when Arrow rejects a column (mixed Python types in an object column)
+    are those columns cast to string.
+    """
+    df = df.reset_index(drop=True)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False, safe=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        bad = [
+            col for col in df.columns
+            if df[col].dtype == object
+            and pd.api.types.infer_dtype(df[col], skipna=True) in ("mixed", "mixed-integer")
+        ]
+        # One astype call for all offending columns
+        df = df.astype(dict.fromkeys(bad, "string"))
+        return pa.Table.from_pandas(df, preserve_index=False, safe=False)
 
 # ==============================
 # Cached Loaders
 # ==============================
-@st.cache_data
-def load_payment_csv(file, skiprows=11):
-    return pd.read_csv(file, skiprows=skiprows)
-
-@st.cache_data
-def load_excel_file(file):
-    return pd.read_excel(file)
-
-@st.cache_data
-def load_zip_csv(file):
-    with zipfile.ZipFile(file) as z:
-        csv_file = [f for f in z.namelist() if f.endswith(".csv")][0]
-        with z.open(csv_file) as f:
-            return pd.read_csv(f)
+# Loaders take the uploaded bytes so Streamlit caches them by content
+PAYMENT_NUMERIC_COLS = ["product sales", "other transaction fees", "other", "total"]
+PAYMENT_TEXT_COLS = ["type", "order id", "Sku"]
+
+PAYMENT_ROW_TYPES = ("Order", "Service Fee")
+
+def parse_amounts(df):
+    """Strip thousands separators from the amount columns and make them numeric."""
+    cols = [c for c in PAYMENT_NUMERIC_COLS if c in df.columns]
+    return df.assign(**{
+        col: pd.to_numeric(df[col].replace({",": ""}, regex=True), errors="coerce")
+        for col in cols
+    })
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_payment_csv(data, skiprows=11):
+    """Parse the payment CSV with PyArrow's threaded reader, cached on its bytes.
+
+    Only the "Order" and "Service Fee" rows are used, so the type filter runs
+    on the Arrow table and just those rows are converted to pandas; returns
+    (order rows, service fee rows). Amounts come through as text ("1,234.50"),
+    so they are read as strings and made numeric once here. Dates and
+    all-null columns stay text, as pandas would have read them.
+    """
+    read_options = pa_csv.ReadOptions(skip_rows=skiprows, use_threads=True)
+    try:
+        schema = pa_csv.open_csv(io.BytesIO(data), read_options=read_options).schema
+        column_types = {
+            field.name: pa.string() for field in schema
+            if field.name in PAYMENT_NUMERIC_COLS + PAYMENT_TEXT_COLS
+            or pa.types.is_temporal(field.type) or pa.types.is_null(field.type)
+        }
+        table = pa_csv.read_csv(
+            io.BytesIO(data),
+            read_options=read_options,
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types,
+                strings_can_be_null=True
+            )
+        )
+        frames = [
+            table.filter(pc.equal(table["type"], row_type)).to_pandas()
+            for row_type in PAYMENT_ROW_TYPES
+        ]
+    except pa.ArrowInvalid:
+        payment_df = pd.read_csv(io.BytesIO(data), skiprows=skiprows)
+        frames = [
+            payment_df[payment_df["type"] == row_type].reset_index(drop=True)
+            for row_type in PAYMENT_ROW_TYPES
+        ]
+
+    orders, service_fees = (parse_amounts(frame) for frame in frames)
+    return orders, service_fees
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_excel_file(data):
+    return pd.read_excel(io.BytesIO(data))
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_zip_csv(data):
+    """Parse the first CSV in a zip, streaming the member straight into PyArrow."""
+    with zipfile.ZipFile(io.BytesIO(data)) as z:
+        csv_file = next(f for f in z.namelist() if f.endswith(".csv"))
+        try:
+            # 1 MiB reads instead of zipfile's small default chunks
+            with z.open(csv_file) as raw, io.BufferedReader(raw, buffer_size=1 << 20) as f:
+                return pa_csv.read_csv(
+                    f,
+                    read_options=pa_csv.ReadOptions(use_threads=True),
+                    convert_options=pa_csv.ConvertOptions(strings_can_be_null=True)
+                ).to_pandas()
+        except pa.ArrowInvalid:
+            with z.open(csv_file) as f:
+                return pd.read_csv(f)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_report_skus(name, data, order_col_idx=4, sku_col_idx=13):
+    """Normalized (order id, SKU) pairs from one B2B/B2C report, first row per order."""
+    report_df = load_zip_csv(data) if name.endswith(".zip") else pd.read_csv(io.BytesIO(data))
+    pairs = pd.DataFrame({
+        "order id": normalize_sku(report_df.iloc[:, order_col_idx]),
+        "Sku": normalize_sku(report_df.iloc[:, sku_col_idx])
+    })
+    return pairs.dropna(subset=["order id"]).drop_duplicates("order id")
+
+def build_sku_lookup(report_frames):
+    """One order id -> SKU lookup across all reports.
+
+    Earlier reports win, but an order whose first row in a report has no SKU
+    falls through to the next report, as with filling report by report.
+    """
+    pairs = pd.concat(report_frames, ignore_index=True)
+    pairs = pairs[pairs["Sku"].notna()].drop_duplicates("order id")
+    return pd.Series(pairs["Sku"].to_numpy(), index=pairs["order id"].to_numpy())
 
 # ==============================
 # Processing Functions
 # ==============================
-def process_payment_data(payment_df):
-    cols = ["other transaction fees", "other", "total"]
-    payment_df[cols] = payment_df[cols].replace({",": ""}, regex=True).apply(
-        pd.to_numeric, errors="coerce"
-    )
-
-    df = payment_df[payment_df["type"] == "Order"].copy()
-    df["product sales"] = pd.to_numeric(df["product sales"], errors="coerce")
-    df = df[df["product sales"] == 0]
-
-    df["Sku"] = df["Sku"].apply(normalize_sku)
-    df["order id"] = df["order id"].apply(normalize_sku)
-
-    df = df[df["Sku"].isna() | (df["Sku"] == "")]
-    return df.reset_index(drop=True)
-
-def fill_sku_from_report(payment_order, report_df, order_col_idx=4, sku_col_idx=13):
-    order_col = report_df.columns[order_col_idx]
-    sku_col = report_df.columns[sku_col_idx]
-
-    report_df[order_col] = report_df[order_col].apply(normalize_sku)
-    report_df[sku_col] = report_df[sku_col].apply(normalize_sku)
-
-    lookup = (
-        report_df.dropna(subset=[order_col])
-        .drop_duplicates(order_col)
-        .set_index(order_col)[sku_col]
-        .to_dict()
-    )
-
+@st.cache_data(show_spinner=False, max_entries=8)
+def process_payment_data(orders):
+    # Build the full predicate first and slice once; no intermediate copy
+    zero_sales = (orders["product sales"] == 0).to_numpy()
+    sku = normalize_sku(orders["Sku"][zero_sales])
+    mask = zero_sales.copy()
+    mask[zero_sales] = (sku.isna() | (sku == "")).to_numpy()
+
+    return orders[mask].assign(**{
+        "Sku": sku[mask[zero_sales]],
+        "order id": normalize_sku(orders["order id"][mask])
+    }).reset_index(drop=True)
+
+def fill_sku_from_report(payment_order, lookup):
+    payment_order = payment_order.copy()
     mask = payment_order["Sku"].isna()
     payment_order.loc[mask, "Sku"] = payment_order.loc[mask, "order id"].map(lookup)
     return payment_order
 
+@st.cache_data(show_spinner=False, max_entries=8)
 def add_brand_info(payment_order, pm_df):
     sku_key = pm_df.columns[2]
-    pm_df[sku_key] = pm_df[sku_key].apply(normalize_sku)
-    payment_order["Sku"] = payment_order["Sku"].apply(normalize_sku)
+    brand_cols = ["Brand", "Brand Manager", "Vendor SKU", "Product Name"]
 
-    pm_unique = pm_df.drop_duplicates(subset=sku_key)
+    # One hash join against a deduplicated PM lookup instead of four maps.
+    # Payment SKUs were already normalized upstream.
+    lut = pm_df[[sku_key, pm_df.columns[6], pm_df.columns[4], pm_df.columns[3], pm_df.columns[7]]]
+    lut.columns = [sku_key] + brand_cols
+    lut = lut.assign(**{sku_key: normalize_sku(lut[sku_key])}).drop_duplicates(subset=sku_key)
 
-    payment_order["Brand"] = payment_order["Sku"].map(pm_unique.set_index(sku_key)[pm_df.columns[6]])
-    payment_order["Brand Manager"] = payment_order["Sku"].map(pm_unique.set_index(sku_key)[pm_df.columns[4]])
-    payment_order["Vendor SKU"] = payment_order["Sku"].map(pm_unique.set_index(sku_key)[pm_df.columns[3]])
-    payment_order["Product Name"] = payment_order["Sku"].map(pm_unique.set_index(sku_key)[pm_df.columns[7]])
+    payment_order = payment_order.merge(lut, left_on="Sku", right_on=sku_key, how="left")
+    if sku_key != "Sku":
+        payment_order = payment_order.drop(columns=[sku_key])
 
     for col in ["Sku", "Vendor SKU"]:
         payment_order[col] = payment_order[col].astype(str)
 
-    cols = payment_order.columns.tolist()
+    cols = [c for c in payment_order.columns if c not in brand_cols]
     sku_idx = cols.index("Sku")
-    for c in ["Brand", "Brand Manager", "Vendor SKU", "Product Name"]:
-        cols.remove(c)
-    for i, c in enumerate(["Brand", "Brand Manager", "Vendor SKU", "Product Name"]):
-        cols.insert(sku_idx + 1 + i, c)
+    cols[sku_idx + 1:sku_idx + 1] = brand_cols
 
-    return payment_order[cols]
+    # Low-cardinality group keys as category so the pivots group on codes.
+    # Sku stays a plain string: it is the merge key above.
+    return payment_order[cols].astype(
+        {c: "category" for c in ("type", "Brand", "Brand Manager") if c in cols}
+    )
 
 def create_pivot_table(df, index_col):
-    df["total"] = pd.to_numeric(df["total"], errors="coerce")
-    pivot = pd.pivot_table(df, index=index_col, values="total", aggfunc="sum")
+    # Single key, single sum: a plain groupby skips pivot_table's reshape path.
+    # "total" is already numeric from load_payment_csv.
+    totals = df.groupby(index_col, observed=True)["total"].sum()
 
-    grand_total = pivot["total"].sum()
-    pivot = pivot.reset_index()
-    pivot.loc[len(pivot)] = ["Grand Total", grand_total]
+    # Append the Grand Total in one concat rather than enlarging via .loc
+    grand_total = pd.DataFrame({index_col: ["Grand Total"], "total": [totals.sum()]})
+    return pd.concat([totals.reset_index(), grand_total], ignore_index=True)
 
-    return pivot
-
-def process_service_fees(payment_df):
-    df = payment_df[payment_df["type"] == "Service Fee"].copy()
+def process_service_fees(df):
     cols = ["other transaction fees", "other", "total"]
-    df[cols] = df[cols].apply(pd.to_numeric, errors="coerce")
 
     summary = df[cols].sum()
     return summary, df
@@ -205,37 +290,43 @@ st.sidebar.info("👆 Upload files, then click **Process Data** below")
 # Process Button in Main Content
 # ==============================
 if st.button("🚀 Process Data", type="primary", use_container_width=True):
-    payment_df = load_payment_csv(payment_file)
-    payment_order = process_payment_data(payment_df)
+    orders, service_fees = load_payment_csv(payment_file.getvalue())
+    payment_order = process_payment_data(orders)
 
     st.markdown(f"<div class='info-box'>✅ Found {len(payment_order)} promotion deduction orders</div>", unsafe_allow_html=True)
 
+    report_frames = []
     for f in b2b_files + b2c_files:
-        df_rep = load_zip_csv(f) if f.name.endswith(".zip") else pd.read_csv(f)
-        payment_order = fill_sku_from_report(payment_order, df_rep)
+        report_frames.append(load_report_skus(f.name, f.getvalue()))
         st.markdown(f"<div class='info-box'>✅ Processed: {f.name}</div>", unsafe_allow_html=True)
+    if report_frames:
+        payment_order = fill_sku_from_report(payment_order, build_sku_lookup(report_frames))
 
-    pm_df = load_excel_file(pm_file)
+    pm_df = load_excel_file(pm_file.getvalue())
     payment_order = add_brand_info(payment_order, pm_df)
 
     st.markdown("<div class='success-box'>🎉 Processing complete</div>", unsafe_allow_html=True)
 
-    # Save to MongoDB
+    # Save to MongoDB; nothing is rendered from the insert, so it runs off the script thread
     from common.mongo import save_reconciliation_report
-    save_reconciliation_report(
-        collection_name="support_ncemi",
-        invoice_no=f"NCEMI_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-        summary_data={
-            "total_orders": len(payment_order),
-            "skus_filled": int(payment_order['Sku'].notna().sum()),
-            "skus_missing": int(payment_order['Sku'].isna().sum())
-        },
-        line_items_data=payment_order,
-        metadata={"report_type": "support_ncemi"}
-    )
+    Thread(
+        target=save_reconciliation_report,
+        kwargs=dict(
+            collection_name="support_ncemi",
+            invoice_no=f"NCEMI_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+            summary_data={
+                "total_orders": len(payment_order),
+                "skus_filled": int(payment_order['Sku'].notna().sum()),
+                "skus_missing": int(payment_order['Sku'].isna().sum())
+            },
+            line_items_data=payment_order,
+            metadata={"report_type": "support_ncemi"}
+        ),
+        daemon=True
+    ).start()
 
     st.session_state.payment_order = payment_order
-    st.session_state.payment_df = payment_df
+    st.session_state.service_fees = service_fees
 
 # ==============================
 # Results
@@ -261,7 +352,7 @@ if "payment_order" in st.session_state:
 
     with tab1:
         pivot_brand = create_pivot_table(df, "Brand")
-        st.dataframe(make_arrow_safe(pivot_brand), use_container_width=True)
+        st.dataframe(make_arrow_safe(pivot_brand), use_container_width=True, hide_index=True)
         download_module_report(
             df=pivot_brand,
             module_name=MODULE_NAME,
@@ -272,7 +363,7 @@ if "payment_order" in st.session_state:
 
     with tab2:
         pivot_mgr = create_pivot_table(df, "Brand Manager")
-        st.dataframe(make_arrow_safe(pivot_mgr), use_container_width=True)
+        st.dataframe(make_arrow_safe(pivot_mgr), use_container_width=True, hide_index=True)
         download_module_report(
             df=pivot_mgr,
             module_name=MODULE_NAME,
@@ -282,14 +373,14 @@ if "payment_order" in st.session_state:
         )
 
     with tab3:
-        summary, service_df = process_service_fees(st.session_state.payment_df)
+        summary, service_df = process_service_fees(st.session_state.service_fees)
 
         c1, c2, c3 = st.columns(3)
         c1.metric("Other Transaction Fees", f"₹{summary['other transaction fees']:,.2f}")
         c2.metric("Other", f"₹{summary['other']:,.2f}")
         c3.metric("Total", f"₹{summary['total']:,.2f}")
 
-        st.dataframe(make_arrow_safe(service_df), use_container_width=True)
+        st.dataframe(make_arrow_safe(service_df), use_container_width=True, hide_index=True)
         download_module_report(
             df=service_df,
             module_name=MODULE_NAME,
@@ -299,7 +390,7 @@ if "payment_order" in st.session_state:
         )
 
     with tab4:
-        st.dataframe(make_arrow_safe(df), use_container_width=True)
+        st.dataframe(make_arrow_safe(paged_view(df, "ncemi_raw_data")), use_container_width=True, hide_index=True)
         download_module_report(
             df=df,
             module_name=MODULE_NAME,
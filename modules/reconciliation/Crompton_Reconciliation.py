@@ -1,45 +1,45 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import re
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
+from rapidfuzz import process
+from rapidfuzz.distance import DamerauLevenshtein
 import io
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
 from common.mongo import save_reconciliation_report
 from common.ui_utils import (
     apply_professional_style, 
     get_download_filename, 
-    render_header,
     download_module_report
 )
 
 MODULE_NAME = "reconciliation"
 
+# Prefer the Rust-based calamine reader (no XML DOM); fall back to openpyxl
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
 # Load environment variables
 load_dotenv()
+AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
+AZURE_KEY = os.getenv("AZURE_KEY")
 
 # Apply Professional UI
 apply_professional_style()
 
-def main():
-    st.set_page_config(page_title="Crompton Reconciliation", layout="wide", page_icon="🔍")
-    render_header("Crompton Reconciliation Tool", "Fuzzy matching enabled for description comparison")
-
-# Load Azure credentials from environment variables
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY = os.getenv("AZURE_KEY")
-
 st.set_page_config(page_title="Crompton Invoice Reconciliation Tool", layout="wide")
 
 st.title("Crompton Invoice Reconciliation Tool")
 st.markdown("Compare PDF invoices with Excel PO data for accurate reconciliation")
 
-# Load Azure credentials from environment variables
-AZURE_ENDPOINT = os.getenv("AZURE_ENDPOINT")
-AZURE_KEY = os.getenv("AZURE_KEY")
-
 # Sidebar for settings only
 with st.sidebar:
     st.header("⚙️ Configuration")
@@ -51,6 +51,39 @@ with st.sidebar:
         value=15,
         help="Acceptable difference in amounts for matching"
     )
+    debug_mode = st.checkbox(
+        "Debug mode",
+        value=False,
+        help="Show extracted PDF data and per-item matching diagnostics"
+    )
+
+class _NumericChars(dict):
+    """str.translate table keeping digits and '.'; any other character is deleted
+    (and remembered, so repeat characters are plain dict hits)"""
+    def __missing__(self, codepoint):
+        self[codepoint] = None
+        return None
+
+NUMERIC_CHARS = _NumericChars({ord(c): c for c in '0123456789.'})
+
+# Patterns used per field / per line, compiled once
+NON_NUMERIC_RE = re.compile(r'[^0-9.]')
+NON_ALNUM_RE = re.compile(r'[^A-Z0-9]')
+NON_ALNUM_LOWER_RE = re.compile(r'[^a-z0-9]')
+MATERIAL_CODE_RE = re.compile(r'(?:Cat Ref|Code|Ref|SKU|Item)\s*:?\s*([A-Z0-9]+)', re.IGNORECASE)
+LEADING_QTY_RE = re.compile(r'^(\d+)\s*(?:NOS|PCS|UNITS?)?', re.IGNORECASE)
+LAYOUT_CODE_RE = re.compile(r'\b([A-Z]{2}[A-Z0-9]{8,})\b')
+LAYOUT_QTY_RE = re.compile(r'(\d+)\s*(?:NOS|PCS|UNITS?)', re.IGNORECASE)
+AMOUNT_RE = re.compile(r'₹?\s*([\d,]+\.?\d*)')
+
+# Request the prebuilt-layout fallback in parallel with prebuilt-invoice. This bills a
+# second Azure call for every PDF, even when the invoice model finds the items, so it is
+# off unless CROMPTON_PREFETCH_LAYOUT=true; otherwise layout is only called when needed
+PREFETCH_LAYOUT = os.getenv("CROMPTON_PREFETCH_LAYOUT", "").strip().lower() in ("1", "true", "yes")
+
+# Material codes within this many edits (after folding I/1, O/0) count as the same code
+CODE_TOLERANCE = 1
+CODE_CONFUSIONS = str.maketrans('10', 'IO')
 
 # Helper Functions
 def clean_num(field):
@@ -61,56 +94,83 @@ def clean_num(field):
     if hasattr(field, 'value_currency') and field.value_currency:
         return float(field.value_currency.amount)
     content = getattr(field, 'content', '0')
-    cleaned = re.sub(r'[^0-9.]', '', str(content))
+    cleaned = str(content).translate(NUMERIC_CHARS)
     try: return float(cleaned)
     except: return 0.0
 
+def clean_currency(series):
+    """Strip everything but digits and '.' from a column and parse it; blanks/invalid become 0.0"""
+    cleaned = series.astype(str).str.replace(NON_NUMERIC_RE, '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0.0)
+
+@st.cache_data(show_spinner=False, max_entries=16)
 def load_and_clean_excel(file_bytes):
     """Load and clean Excel file"""
-    raw_df = pd.read_excel(io.BytesIO(file_bytes), header=None)
-    header_row_idx = raw_df[raw_df.apply(lambda r: r.astype(str).str.contains('SKU').any(), axis=1)].index[0]
+    raw_df = pd.read_excel(
+        io.BytesIO(file_bytes),
+        header=None,
+        # openpyxl cannot open legacy .xls, so let pandas pick when calamine is absent
+        engine="calamine" if EXCEL_ENGINE == "calamine" else None,
+    )
+    # First row with 'SKU' in any cell, found with one vectorized substring scan
+    has_sku = (np.char.find(raw_df.to_numpy().astype(str), 'SKU') >= 0).any(axis=1)
+    if not has_sku.any():
+        raise ValueError("No header row containing 'SKU' found in the Excel file")
+    header_row_idx = int(has_sku.argmax())
     
-    df = pd.read_excel(io.BytesIO(file_bytes), header=header_row_idx)
-    df.columns = df.columns.astype(str).str.strip()
+    # Promote the SKU row to the header in memory instead of parsing the workbook again,
+    # keeping only the columns used below so dtype inference skips the rest of the sheet
+    header = raw_df.iloc[header_row_idx].astype(str).str.strip().to_numpy()
+    po_ref_cols = np.flatnonzero(header == 'PO Ref No.')
+    po_ref_col = int(po_ref_cols[0]) if po_ref_cols.size else 3
+    used_cols = list(dict.fromkeys([0, 1, po_ref_col, 4, 10, 11]))
+    df = raw_df.iloc[header_row_idx + 1:, used_cols].reset_index(drop=True).infer_objects()
 
     cleaned_items = pd.DataFrame()
     
     # Material Code extraction with better handling
-    material_codes = df.iloc[:, 0].astype(str).str.replace('CR-', '', regex=False).str.replace('WO-', '', regex=False).str.strip()
+    material_codes = df[0].astype(str).str.replace('CR-', '', regex=False).str.replace('WO-', '', regex=False).str.strip()
     # Ensure proper case - material codes are typically uppercase
     cleaned_items['Material Code'] = material_codes.str.upper()
     
-    cleaned_items['Description'] = df.iloc[:, 1].astype(str).str.strip()
-    
-    if 'PO Ref No.' in df.columns:
-        cleaned_items['PO Ref No.'] = df['PO Ref No.'].astype(str).str.strip()
-    else:
-        cleaned_items['PO Ref No.'] = df.iloc[:, 3].astype(str).str.strip()
+    cleaned_items['Description'] = df[1].astype(str).str.strip()
+    cleaned_items['PO Ref No.'] = df[po_ref_col].astype(str).str.strip()
     
-    def clean_currency(value):
-        if pd.isna(value): return 0.0
-        cleaned = re.sub(r'[^0-9.]', '', str(value))
-        try: return float(cleaned)
-        except ValueError: return 0.0
-
-    cleaned_items['Qty_EXCEL'] = df.iloc[:, 4].apply(clean_currency)
-    cleaned_items['Tax_EXCEL'] = df.iloc[:, 10].apply(clean_currency)
-    cleaned_items['Total_EXCEL'] = df.iloc[:, 11].apply(clean_currency)
+    cleaned_items['Qty_EXCEL'] = clean_currency(df[4])
+    cleaned_items['Tax_EXCEL'] = clean_currency(df[10])
+    cleaned_items['Total_EXCEL'] = clean_currency(df[11])
     
     cleaned_items = cleaned_items[cleaned_items['Material Code'] != 'NAN'].reset_index(drop=True)
     return cleaned_items
 
+@st.cache_resource(show_spinner=False)
+def get_azure_client(endpoint: str, key: str):
+    """One Document Intelligence client per endpoint/key, reused across reruns for its connection pool"""
+    return DocumentIntelligenceClient(endpoint, AzureKeyCredential(key))
+
+# Cached on the PDF bytes: re-running (e.g. after changing the tolerance) skips the Azure calls
+@st.cache_data(show_spinner=False, max_entries=16)
 def extract_pdf_data(pdf_bytes, endpoint, key):
     """Extract data from PDF invoice with enhanced parsing and fallback methods"""
-    client = DocumentIntelligenceClient(endpoint, AzureKeyCredential(key))
+    client = get_azure_client(endpoint, key)
     
-    # First attempt: Use prebuilt-invoice model
-    poller = client.begin_analyze_document(
-        "prebuilt-invoice", AnalyzeDocumentRequest(bytes_source=pdf_bytes)
-    )
-    result = poller.result()
+    def analyze(model_id):
+        return client.begin_analyze_document(
+            model_id, AnalyzeDocumentRequest(bytes_source=pdf_bytes)
+        ).result()
     
-    all_line_items = []
+    # First attempt: Use prebuilt-invoice model. With PREFETCH_LAYOUT the layout fallback
+    # is requested alongside it so its round-trip is already done if the invoice model
+    # finds no items; that call runs (and is billed) either way.
+    executor = ThreadPoolExecutor(max_workers=2)
+    invoice_future = executor.submit(analyze, "prebuilt-invoice")
+    layout_future = executor.submit(analyze, "prebuilt-layout") if PREFETCH_LAYOUT else None
+    executor.shutdown(wait=False)
+    result = invoice_future.result()
+    
+    # Line items as (Description, Material_Code, Quantity_PDF, Amount_Base, Unit_Price) keys of
+    # an insertion-ordered dict, which drops exact duplicates as they are appended
+    all_line_items = {}
     invoice_summary = {"Invoice_No": "N/A", "Sub_Total": 0.0, "Grand_Total": 0.0, "Calculated_Tax": 0.0}
 
     for invoice in result.documents:
@@ -146,7 +206,7 @@ def extract_pdf_data(pdf_bytes, endpoint, key):
                 
                 # Extract material code from description if present
                 # Look for patterns like "Cat Ref : CFHSGIN48TAP1S" or "Code: XXX"
-                material_code_match = re.search(r'(?:Cat Ref|Code|Ref|SKU|Item)\s*:?\s*([A-Z0-9]+)', desc, re.IGNORECASE)
+                material_code_match = MATERIAL_CODE_RE.search(desc)
                 if material_code_match:
                     product_code = material_code_match.group(1)
                 
@@ -155,7 +215,7 @@ def extract_pdf_data(pdf_bytes, endpoint, key):
                 
                 # Try to extract quantity from description if not found
                 if qty == 0.0 and desc != "N/A":
-                    qty_match = re.search(r'^(\d+)\s*(?:NOS|PCS|UNITS?)?', desc.strip(), re.IGNORECASE)
+                    qty_match = LEADING_QTY_RE.search(desc.strip())
                     if qty_match:
                         qty = float(qty_match.group(1))
                 
@@ -173,23 +233,20 @@ def extract_pdf_data(pdf_bytes, endpoint, key):
                 if desc == "N/A" or (amount == 0.0 and qty == 0.0):
                     continue
 
-                all_line_items.append({
-                    "Description": desc,
-                    "Material_Code": product_code.strip() if product_code else "",
-                    "Quantity_PDF": qty if qty > 0 else 1.0,
-                    "Amount_Base": amount,
-                    "Unit_Price": unit_price
-                })
+                all_line_items[(
+                    desc,
+                    product_code.strip() if product_code else "",
+                    qty if qty > 0 else 1.0,
+                    amount,
+                    unit_price
+                )] = None
 
     # Fallback: If no line items found, try layout-based extraction
     if len(all_line_items) == 0:
         st.warning("⚠️ Prebuilt invoice model found no items. Attempting layout-based extraction...")
         
         # Use layout model as fallback
-        poller_layout = client.begin_analyze_document(
-            "prebuilt-layout", AnalyzeDocumentRequest(bytes_source=pdf_bytes)
-        )
-        layout_result = poller_layout.result()
+        layout_result = layout_future.result() if layout_future else analyze("prebuilt-layout")
         
         # Extract all text and look for material codes and amounts
         full_text = ""
@@ -203,16 +260,16 @@ def extract_pdf_data(pdf_bytes, endpoint, key):
         lines = full_text.split('\n')
         for i, line in enumerate(lines):
             # Look for material code patterns (alphanumeric codes)
-            code_match = re.search(r'\b([A-Z]{2}[A-Z0-9]{8,})\b', line)
+            code_match = LAYOUT_CODE_RE.search(line)
             if code_match:
                 material_code = code_match.group(1)
                 
                 # Look for quantity pattern (number followed by NOS/PCS/UNITS)
-                qty_match = re.search(r'(\d+)\s*(?:NOS|PCS|UNITS?)', line, re.IGNORECASE)
+                qty_match = LAYOUT_QTY_RE.search(line)
                 qty = float(qty_match.group(1)) if qty_match else 1.0
                 
                 # Look for amount (currency pattern)
-                amount_match = re.search(r'₹?\s*([\d,]+\.?\d*)', line)
+                amount_match = AMOUNT_RE.search(line)
                 amount = 0.0
                 if amount_match:
                     amount_str = amount_match.group(1).replace(',', '')
@@ -224,19 +281,17 @@ def extract_pdf_data(pdf_bytes, endpoint, key):
                 # Get description (text before or after code)
                 desc = line.strip()
                 
-                all_line_items.append({
-                    "Description": desc,
-                    "Material_Code": material_code,
-                    "Quantity_PDF": qty,
-                    "Amount_Base": amount,
-                    "Unit_Price": 0.0
-                })
-
-    df_items = pd.DataFrame(all_line_items).drop_duplicates().reset_index(drop=True)
+                all_line_items[(desc, material_code, qty, amount, 0.0)] = None
+
+    df_items = pd.DataFrame(
+        list(all_line_items),
+        columns=["Description", "Material_Code", "Quantity_PDF", "Amount_Base", "Unit_Price"]
+    )
     
-    # Clean description for better matching
+    # Clean description and normalized code for matching, computed once here
     if not df_items.empty:
         df_items['Clean_Desc'] = df_items['Description'].str.lower().str.strip()
+        df_items['Material_Code_Upper'] = df_items['Material_Code'].fillna('').astype(str).str.strip().str.upper()
     
     return df_items, invoice_summary
 
@@ -249,124 +304,123 @@ def normalize_code_for_matching(code):
     # I/1, O/0, S/5 are commonly confused
     return code
 
-def codes_are_similar(code1, code2, tolerance=1):
-    """Check if two codes are similar allowing for character confusion"""
-    if code1 == code2:
-        return True
-    
-    # Normalize both codes
-    c1 = str(code1).upper().strip()
-    c2 = str(code2).upper().strip()
-    
-    if c1 == c2:
-        return True
-    
-    # Check with I<->1 substitution
-    c1_sub = c1.replace('I', '1').replace('1', 'I')
-    if c1_sub == c2 or c1 == c2.replace('I', '1').replace('1', 'I'):
-        return True
-    
-    # Check with O<->0 substitution
-    c1_sub = c1.replace('O', '0').replace('0', 'O')
-    if c1_sub == c2 or c1 == c2.replace('O', '0').replace('0', 'O'):
-        return True
+def codes_are_similar(code1, code2, tolerance=CODE_TOLERANCE):
+    """Check if two codes are similar allowing for character confusion
+    (I/1, O/0) plus up to `tolerance` edits or transpositions"""
+    c1 = fold_code(str(code1).upper().strip())
+    c2 = fold_code(str(code2).upper().strip())
+    return DamerauLevenshtein.distance(c1, c2, score_cutoff=tolerance) <= tolerance
+
+def fold_code(code):
+    """Fold the commonly confused I/1 and O/0 to one character each"""
+    return code.translate(CODE_CONFUSIONS)
+
+def build_text_index(texts):
+    """Join the non-null texts with NUL separators so a substring search over every row
+    is one str.find; returns (blob, start offset of each row, row positions)"""
+    valid = texts.notna().to_numpy()
+    rows = texts[valid].tolist()
+    starts = np.cumsum([0] + [len(t) + 1 for t in rows[:-1]])
+    return '\x00'.join(rows), starts, np.flatnonzero(valid)
+
+def first_row_containing(text_index, needle):
+    """Position of the first row whose text contains needle, or -1"""
+    blob, starts, positions = text_index
+    at = blob.find(needle) if positions.size else -1
+    if at < 0:
+        return -1
+    return positions[np.searchsorted(starts, at, side='right') - 1]
+
+def find_desc_match(desc_index, alnum_index, m_code):
+    """Position of the first PDF row whose description holds m_code (strategies 3-4), or -1"""
+    # Strategy 3: Match by Material Code in description
+    pos = first_row_containing(desc_index, m_code.lower())
+    if pos >= 0:
+        return pos
     
-    # Check Levenshtein distance (allow 1 character difference)
-    if len(c1) == len(c2):
-        differences = sum(1 for a, b in zip(c1, c2) if a != b)
-        return differences <= tolerance
-    
-    return False
+    # Strategy 4: Fuzzy match by removing special characters
+    clean_code = NON_ALNUM_RE.sub('', m_code)
+    return first_row_containing(alnum_index, clean_code.lower())
 
 def perform_reconciliation(pdf_items, pdf_summary, excel_df, tolerance_val):
     """Perform reconciliation between PDF and Excel data with improved matching"""
-    comparison_rows = []
-    total_checks = 0
-    passed_checks = 0
-    
     # Prepare PDF items for matching
     if 'Clean_Desc' not in pdf_items.columns and not pdf_items.empty:
         pdf_items['Clean_Desc'] = pdf_items['Description'].str.lower().str.strip()
     
     # Create a normalized Material_Code column in PDF items if it doesn't exist
-    if not pdf_items.empty and 'Material_Code' in pdf_items.columns:
+    if 'Material_Code_Upper' not in pdf_items.columns and not pdf_items.empty and 'Material_Code' in pdf_items.columns:
         pdf_items['Material_Code_Upper'] = pdf_items['Material_Code'].str.strip().str.upper()
 
-    for _, ex_row in excel_df.iterrows():
-        m_code = str(ex_row['Material Code']).strip().upper()
-        ex_qty = float(ex_row['Qty_EXCEL'])
-        ex_total = float(ex_row['Total_EXCEL'])
-        ex_tax = float(ex_row['Tax_EXCEL']) if 'Tax_EXCEL' in ex_row else 0
-        ex_base = ex_total - ex_tax  # Calculate base amount (without tax)
-        
-        # Try multiple matching strategies
-        matched_pdf = pd.DataFrame()
-        
-        if not pdf_items.empty:
-            # Strategy 1: Direct match by Material Code field (case-insensitive)
-            if 'Material_Code_Upper' in pdf_items.columns:
-                matched_pdf = pdf_items[pdf_items['Material_Code_Upper'] == m_code]
-            
-            # Strategy 2: Fuzzy match with similar codes (handles I/1, O/0 confusion)
-            if matched_pdf.empty and 'Material_Code_Upper' in pdf_items.columns:
-                for idx, row in pdf_items.iterrows():
-                    if codes_are_similar(row['Material_Code_Upper'], m_code):
-                        matched_pdf = pdf_items.iloc[[idx]]
-                        break
-            
-            # Strategy 3: Match by Material Code in description
-            if matched_pdf.empty and 'Clean_Desc' in pdf_items.columns:
-                matched_pdf = pdf_items[pdf_items['Clean_Desc'].str.contains(m_code.lower(), regex=False, na=False)]
-            
-            # Strategy 4: Fuzzy match by removing special characters
-            if matched_pdf.empty and 'Clean_Desc' in pdf_items.columns:
-                clean_code = re.sub(r'[^A-Z0-9]', '', m_code)
-                matched_pdf = pdf_items[pdf_items['Clean_Desc'].str.replace(r'[^a-z0-9]', '', regex=True).str.contains(clean_code.lower(), regex=False, na=False)]
+    m_codes = excel_df['Material Code'].map(str).str.strip().str.upper()
+    ex_qty = excel_df['Qty_EXCEL'].astype(float).to_numpy()
+    ex_total = excel_df['Total_EXCEL'].astype(float).to_numpy()
+    ex_tax = excel_df['Tax_EXCEL'].astype(float).to_numpy() if 'Tax_EXCEL' in excel_df.columns else 0
+    ex_base = ex_total - ex_tax  # Calculate base amount (without tax)
+    
+    # Position of the matched PDF row for every Excel row (-1 = not found)
+    match_pos = np.full(len(excel_df), -1)
+    if not pdf_items.empty:
+        # Strategy 1: Direct match by Material Code field (case-insensitive),
+        # as one hash lookup against the first PDF row of each code
+        if 'Material_Code_Upper' in pdf_items.columns:
+            first_pos = pd.Series(np.arange(len(pdf_items)), index=pdf_items['Material_Code_Upper'].to_numpy())
+            first_pos = first_pos[~first_pos.index.duplicated()]
+            match_pos = m_codes.map(first_pos).fillna(-1).astype(int).to_numpy(copy=True)
         
-        total_checks += 1
+        # Strategy 2: Fuzzy match with similar codes (handles I/1, O/0 confusion),
+        # scored for all rows the exact match missed in one cdist call
+        missing = np.flatnonzero((match_pos < 0) & (m_codes != '').to_numpy())
+        if missing.size and 'Material_Code_Upper' in pdf_items.columns:
+            pdf_codes = pdf_items['Material_Code_Upper'].tolist()
+            dist = process.cdist(
+                m_codes.iloc[missing].tolist(), pdf_codes,
+                scorer=DamerauLevenshtein.distance, processor=fold_code,
+                score_cutoff=CODE_TOLERANCE, workers=-1
+            )
+            close = (dist <= CODE_TOLERANCE) & np.array([code != '' for code in pdf_codes])
+            hit = close.any(axis=1)
+            match_pos[missing[hit]] = close[hit].argmax(axis=1)
         
-        if not matched_pdf.empty:
-            passed_checks += 1
-            pdf_row = matched_pdf.iloc[0]
-            qty_pdf = float(pdf_row['Quantity_PDF'])
-            amt_pdf = float(pdf_row['Amount_Base'])
-            
-            # Quantity check
-            total_checks += 1
-            qty_match = (ex_qty == qty_pdf)
-            if qty_match: passed_checks += 1
-            
-            # Amount check - compare base amounts (without tax) with tolerance
-            total_checks += 1
-            # Try matching with both total and base amount
-            amt_match_total = abs(ex_total - amt_pdf) < tolerance_val
-            amt_match_base = abs(ex_base - amt_pdf) < tolerance_val
-            amt_match = amt_match_total or amt_match_base
-            if amt_match: passed_checks += 1
-            
-            comparison_rows.append({
-                "Material_Code": m_code,
-                "Description_PDF": pdf_row['Description'][:50],
-                "Qty_Excel": ex_qty,
-                "Qty_PDF": qty_pdf,
-                "Qty_Status": "✅" if qty_match else "❌",
-                "Total_Excel": ex_total,
-                "Amount_PDF": amt_pdf,
-                "Amount_Status": "✅" if amt_match else "❌",
-                "Match": "✅"
-            })
-        else:
-            comparison_rows.append({
-                "Material_Code": m_code, 
-                "Description_PDF": "NOT FOUND",
-                "Qty_Excel": ex_qty, 
-                "Qty_PDF": 0, 
-                "Qty_Status": "❌",
-                "Total_Excel": ex_total, 
-                "Amount_PDF": 0, 
-                "Amount_Status": "❌",
-                "Match": "❌"
-            })
+        # Strategies 3-4 only for the rows still unmatched; the descriptions are
+        # indexed once so each PO line is a single substring search
+        if 'Clean_Desc' in pdf_items.columns:
+            clean_desc = pdf_items['Clean_Desc']
+            desc_index = build_text_index(clean_desc)
+            alnum_index = build_text_index(clean_desc.str.replace(NON_ALNUM_LOWER_RE, '', regex=True))
+            for i in np.flatnonzero(match_pos < 0):
+                match_pos[i] = find_desc_match(desc_index, alnum_index, m_codes.iat[i])
+    
+    found = match_pos >= 0
+    qty_pdf = np.zeros(len(excel_df))
+    amt_pdf = np.zeros(len(excel_df))
+    desc_pdf = np.full(len(excel_df), "NOT FOUND", dtype=object)
+    if found.any():
+        pdf_rows = pdf_items.iloc[match_pos[found]]
+        qty_pdf[found] = pdf_rows['Quantity_PDF'].astype(float)
+        amt_pdf[found] = pdf_rows['Amount_Base'].astype(float)
+        desc_pdf[found] = pdf_rows['Description'].str[:50]
+    
+    # Quantity check, and amount check against both the total and the base amount (without tax)
+    qty_match = found & (ex_qty == qty_pdf)
+    amt_match = found & ((np.abs(ex_total - amt_pdf) < tolerance_val) | (np.abs(ex_base - amt_pdf) < tolerance_val))
+    
+    # One code check per Excel row, plus qty and amount checks for matched rows
+    total_checks = len(excel_df) + 2 * int(found.sum())
+    passed_checks = int(found.sum() + qty_match.sum() + amt_match.sum())
+    
+    status = lambda mask: np.where(mask, "✅", "❌")
+    report_df = pd.DataFrame({
+        "Material_Code": m_codes.to_numpy(),
+        "Description_PDF": desc_pdf,
+        "Qty_Excel": ex_qty,
+        "Qty_PDF": qty_pdf,
+        "Qty_Status": status(qty_match),
+        "Total_Excel": ex_total,
+        "Amount_PDF": amt_pdf,
+        "Amount_Status": status(amt_match),
+        "Match": status(found)
+    })
 
     # Summary calculations
     excel_tax_sum = excel_df['Tax_EXCEL'].sum()
@@ -382,7 +436,6 @@ def perform_reconciliation(pdf_items, pdf_summary, excel_df, tolerance_val):
     if tax_match: passed_checks += 1
     if grand_total_match: passed_checks += 1
 
-    report_df = pd.DataFrame(comparison_rows)
     
     summary_results = [
         {"Metric": "PO Ref vs Invoice", "Excel": excel_df['PO Ref No.'].iloc[0], "PDF": pdf_summary['Invoice_No'], "Status": "✅" if po_match else "❌"},
@@ -415,11 +468,11 @@ if st.button("🔍 Run Reconciliation", type="primary", disabled=not (pdf_file a
         with st.spinner("Processing files..."):
             try:
                 # Load Excel data
-                excel_bytes = excel_file.read()
+                excel_bytes = excel_file.getvalue()
                 excel_df = load_and_clean_excel(excel_bytes)
                 
                 # Extract PDF data
-                pdf_bytes = pdf_file.read()
+                pdf_bytes = pdf_file.getvalue()
                 pdf_items, pdf_summary = extract_pdf_data(pdf_bytes, AZURE_ENDPOINT, AZURE_KEY)
                 
                 # Perform reconciliation
@@ -430,71 +483,77 @@ if st.button("🔍 Run Reconciliation", type="primary", disabled=not (pdf_file a
                 # Display results
                 st.success(f"✅ Reconciliation Complete!")
                 
-                # Debug information (expandable)
-                with st.expander("🔍 Debug: PDF Extracted Data"):
-                    st.write("**Extracted Line Items from PDF:**")
-                    if pdf_items.empty:
-                        st.error("No line items extracted from PDF!")
-                    else:
-                        st.dataframe(pdf_items, use_container_width=True)
+                # Debug information (expandable); the per-row diagnostics are only
+                # computed when debug mode is switched on in the sidebar
+                if debug_mode:
+                    with st.expander("🔍 Debug: PDF Extracted Data"):
+                        st.write("**Extracted Line Items from PDF:**")
+                        if pdf_items.empty:
+                            st.error("No line items extracted from PDF!")
+                        else:
+                            st.dataframe(pdf_items, use_container_width=True)
                     
-                    st.write("**Excel Data:**")
-                    st.dataframe(excel_df[['Material Code', 'Description', 'Qty_EXCEL', 'Total_EXCEL']], use_container_width=True)
+                        st.write("**Excel Data:**")
+                        st.dataframe(excel_df[['Material Code', 'Description', 'Qty_EXCEL', 'Total_EXCEL']], use_container_width=True)
                     
-                    # Show matching diagnostics
-                    st.write("**Matching Diagnostics:**")
-                    for _, ex_row in excel_df.iterrows():
-                        m_code = str(ex_row['Material Code']).strip().upper()
-                        st.write(f"- Looking for: `{m_code}`")
+                        # Show matching diagnostics
+                        st.write("**Matching Diagnostics:**")
+                        pdf_codes = pdf_items['Material_Code_Upper'].tolist() if 'Material_Code_Upper' in pdf_items.columns else []
+                        # First PDF row of each normalized code, for O(1) exact lookups
+                        code_index = {}
+                        for pos, code in enumerate(pdf_codes):
+                            code_index.setdefault(code, pos)
+                        for _, ex_row in excel_df.iterrows():
+                            m_code = str(ex_row['Material Code']).strip().upper()
+                            st.write(f"- Looking for: `{m_code}`")
                         
-                        if not pdf_items.empty:
-                            # Try all matching strategies
-                            found = False
+                            if not pdf_items.empty:
+                                # Try all matching strategies
+                                found = False
                             
-                            # Strategy 1: Direct material code match
-                            if 'Material_Code' in pdf_items.columns:
-                                matches = pdf_items[pdf_items['Material_Code'].str.strip().str.upper() == m_code]
-                                if not matches.empty:
+                                # Strategy 1: Direct material code match
+                                if m_code in code_index:
+                                    match = pdf_items.iloc[code_index[m_code]]
                                     st.success(f"  ✅ Strategy 1 (Exact Match): Found in PDF")
-                                    st.write(f"     Description: {matches.iloc[0]['Description'][:60]}")
-                                    st.write(f"     Quantity: {matches.iloc[0]['Quantity_PDF']}, Amount: {matches.iloc[0]['Amount_Base']}")
+                                    st.write(f"     Description: {match['Description'][:60]}")
+                                    st.write(f"     Quantity: {match['Quantity_PDF']}, Amount: {match['Amount_Base']}")
                                     found = True
                             
-                            # Strategy 2: Fuzzy match (I/1, O/0)
-                            if not found and 'Material_Code' in pdf_items.columns:
-                                for idx, row in pdf_items.iterrows():
-                                    pdf_code = str(row['Material_Code']).strip().upper()
-                                    if codes_are_similar(pdf_code, m_code):
-                                        st.success(f"  ✅ Strategy 2 (Fuzzy Match): Found similar code")
-                                        st.write(f"     Excel Code: `{m_code}` → PDF Code: `{pdf_code}`")
-                                        st.write(f"     Description: {row['Description'][:60]}")
-                                        st.write(f"     Quantity: {row['Quantity_PDF']}, Amount: {row['Amount_Base']}")
-                                        found = True
-                                        break
+                                # Strategy 2: Fuzzy match (I/1, O/0)
+                                if not found:
+                                    for pos, pdf_code in enumerate(pdf_codes):
+                                        if codes_are_similar(pdf_code, m_code):
+                                            row = pdf_items.iloc[pos]
+                                            st.success(f"  ✅ Strategy 2 (Fuzzy Match): Found similar code")
+                                            st.write(f"     Excel Code: `{m_code}` → PDF Code: `{pdf_code}`")
+                                            st.write(f"     Description: {row['Description'][:60]}")
+                                            st.write(f"     Quantity: {row['Quantity_PDF']}, Amount: {row['Amount_Base']}")
+                                            found = True
+                                            break
                             
-                            # Strategy 3: Code in description
-                            if not found and 'Clean_Desc' in pdf_items.columns:
-                                matches = pdf_items[pdf_items['Clean_Desc'].str.contains(m_code.lower(), regex=False, na=False)]
-                                if not matches.empty:
-                                    st.success(f"  ✅ Strategy 3 (Code in Desc): Found in PDF")
-                                    st.write(f"     Description: {matches.iloc[0]['Description'][:60]}")
-                                    found = True
+                                # Strategy 3: Code in description
+                                if not found and 'Clean_Desc' in pdf_items.columns:
+                                    matches = pdf_items[pdf_items['Clean_Desc'].str.contains(m_code.lower(), regex=False, na=False)]
+                                    if not matches.empty:
+                                        st.success(f"  ✅ Strategy 3 (Code in Desc): Found in PDF")
+                                        st.write(f"     Description: {matches.iloc[0]['Description'][:60]}")
+                                        found = True
                             
-                            if not found:
-                                st.error(f"  ❌ Not found with any strategy")
-                                st.write(f"  **Available Material Codes in PDF:**")
-                                if 'Material_Code' in pdf_items.columns:
-                                    codes = pdf_items['Material_Code'].tolist()
-                                    st.write(f"  {codes}")
-                                    # Show similarity check
-                                    st.write(f"  **Similarity Check:**")
-                                    for pdf_code in codes:
-                                        if codes_are_similar(str(pdf_code).upper(), m_code):
-                                            st.warning(f"    `{pdf_code}` is similar to `{m_code}`")
-                                st.write(f"  **Sample Descriptions from PDF:**")
-                                st.write(pdf_items['Description'].head(3).tolist())
-                        else:
-                            st.error("  ❌ PDF items list is empty!")
+                                if not found:
+                                    st.error(f"  ❌ Not found with any strategy")
+                                    st.write(f"  **Available Material Codes in PDF:**")
+                                    if 'Material_Code' in pdf_items.columns:
+                                        codes = pdf_items['Material_Code'].tolist()
+                                        st.write(f"  {codes}")
+                                        # Show similarity check
+                                        st.write(f"  **Similarity Check:**")
+                                        for pdf_code in codes:
+                                            if codes_are_similar(str(pdf_code).upper(), m_code):
+                                                st.warning(f"    `{pdf_code}` is similar to `{m_code}`")
+                                    st.write(f"  **Sample Descriptions from PDF:**")
+                                    st.write(pdf_items['Description'].head(3).tolist())
+                            else:
+                                st.error("  ❌ PDF items list is empty!")
                 
                 # Accuracy metric
                 col1, col2, col3 = st.columns(3)
@@ -4,14 +4,16 @@ import ast
 import json
 import re
 import logging
+import functools
 
+import numpy as np
 import pandas as pd
 import streamlit as st
-from rapidfuzz import fuzz
+import xlsxwriter
+from rapidfuzz import fuzz, process
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
-from openpyxl import Workbook
 from common.mongo import save_reconciliation_report
 from common.ui_utils import (
     apply_professional_style, 
@@ -24,6 +26,20 @@ from common.ui_utils import (
 MODULE_NAME = "reconciliation"
 TOOL_NAME = "dyson_reconciliation"
 
+# Prefer the Rust-based calamine reader (no XML DOM); fall back to openpyxl
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+# orjson parses the JSON-shaped OCR payloads several times faster; stdlib json otherwise
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # ======================================================================
 # INITIAL SETUP
 # ======================================================================
@@ -39,6 +55,54 @@ NAME_THRESHOLD = 90
 AMOUNT_TOL_PCT = 0.005   # 0.5%
 SKU_STRICT = False
 
+# Patterns used per cell / per OCR field, compiled once
+WS_RE = re.compile(r"\s+")
+PAREN_NEG_RE = re.compile(r'^\((.+)\)$')
+RATE_RE = re.compile(r'(\d+(?:\.\d+)?)%')
+CAND_UP_RE = re.compile(r"\b[A-Z]{2,}[0-9A-Z\-_/]{3,}\b")
+CAND_ALNUM_RE = re.compile(r"\b[A-Za-z0-9]{6,}\b")
+DIGITS_ONLY_RE = re.compile(r"\d{6,}")
+YOUR_REF_RE = re.compile(r"Your\s+Reference[:\s]+([A-Z0-9]{6,})", re.IGNORECASE)
+NUMLIKE_RE = re.compile(r"^\s*$|^\d+(\.\d+)?$")
+
+# Excel header phrases rewritten to their canonical column names, in one regex pass
+# (longest phrase first, so "po ref no" wins over "po ref")
+CANON_COL_MAP = {
+    "ean/upc": "ean_upc",
+    "po ref no": "po_ref_no",
+    "po ref": "po_ref_no",
+    "ordered quantity": "ordered_quantity",
+    "pending quantity": "pending_quantity",
+    "base price": "base_price",
+    "item price": "item_price",
+    "tax rate": "tax_rate",
+    "included tax": "included_tax",
+    "total value": "total_value",
+}
+CANON_COL_RE = re.compile(
+    "|".join(re.escape(k) for k in sorted(CANON_COL_MAP, key=len, reverse=True))
+)
+
+
+class _ColChars(dict):
+    """str.translate table keeping [0-9a-z_]; any other character is deleted
+    (and remembered, so repeat characters are plain dict hits)"""
+    def __missing__(self, codepoint):
+        self[codepoint] = None
+        return None
+
+
+COL_CHARS = _ColChars({ord(c): c for c in "0123456789abcdefghijklmnopqrstuvwxyz_"})
+
+# Turns a single-quoted repr into JSON-style quoting for the last-resort parse
+QUOTE_TRANS = str.maketrans({"'": '"'})
+
+# Header names that mark an invoice field as the customer's reference
+REF_KEY_TERMS = ("reference", "your", "ref", "po")
+
+# Numeric OCR item fields that are totalled per invoice
+OCR_SUM_FIELDS = ("CGST", "SGST", "Tax", "Quantity")
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
@@ -50,14 +114,26 @@ logger = logging.getLogger(__name__)
 # UTILITY FUNCTIONS
 # ======================================================================
 
-def norm_text(s):
+def _norm_text(s):
     if s is None:
         return ""
     s = str(s).replace("\r", "\n").replace("\n", " ")
-    s = re.sub(r"\s+", " ", s)
+    s = WS_RE.sub(" ", s)
     return s.strip()
 
 
+# OCR names and Excel cells repeat heavily, so the pure string helpers are memoised;
+# typed=True keeps 1, 1.0 and True apart, and unhashable input skips the cache
+_norm_text_cached = functools.lru_cache(maxsize=4096, typed=True)(_norm_text)
+
+
+def norm_text(s):
+    try:
+        return _norm_text_cached(s)
+    except TypeError:
+        return _norm_text(s)
+
+
 def fuzzy_score(a, b):
     return int(
         fuzz.token_sort_ratio(
@@ -67,7 +143,7 @@ def fuzzy_score(a, b):
     )
 
 
-def parse_number(x):
+def _parse_number(x):
     if x is None:
         return None
     if isinstance(x, (int, float)) and not isinstance(x, bool):
@@ -81,7 +157,7 @@ def parse_number(x):
             return float(s[:-1]) / 100.0
         except Exception:
             return None
-    m = re.match(r'^\((.+)\)$', s)
+    m = PAREN_NEG_RE.match(s)
     if m:
         try:
             return -float(m.group(1).replace(",", ""))
@@ -93,22 +169,70 @@ def parse_number(x):
         return None
 
 
+_parse_number_cached = functools.lru_cache(maxsize=4096, typed=True)(_parse_number)
+
+
+def parse_number(x):
+    try:
+        return _parse_number_cached(x)
+    except TypeError:
+        return _parse_number(x)
+
+
+def parse_number_series(col):
+    # Column-wise parse_number: when every cleaned cell is a plain number the whole
+    # column is converted in one astype (same float() parsing); otherwise (percentages,
+    # (negatives), text) fall back to the memoised per-cell parser
+    cleaned = (
+        col.astype(str)
+        .str.replace("₹", "", regex=False)
+        .str.replace("inr", "", regex=False)
+        .str.replace(",", "", regex=False)
+        .str.strip()
+    )
+    try:
+        return cleaned.astype(object).astype(float)
+    except (TypeError, ValueError):
+        return col.map(parse_number).astype(float)
+
+
+def _scalar_val_conf(field):
+    return field, None
+
+
+def _dict_val_conf(field):
+    conf = field.get("confidence")
+    if isinstance(field.get("valueCurrency"), dict):
+        return field["valueCurrency"].get("amount"), conf
+    if "valueNumber" in field:
+        return field.get("valueNumber"), conf
+    if "valueString" in field:
+        return field.get("valueString"), conf
+    if "content" in field:
+        return field.get("content"), conf
+    return str(field), conf
+
+
+# Exact-type fast paths for the plain JSON values most OCR fields arrive as
+_VAL_CONF_HANDLERS = {
+    type(None): lambda field: (None, None),
+    str: _scalar_val_conf,
+    int: _scalar_val_conf,
+    float: _scalar_val_conf,
+    bool: _scalar_val_conf,
+    dict: _dict_val_conf,
+}
+
+
 def get_val_conf(field):
-    if field is None:
-        return None, None
+    handler = _VAL_CONF_HANDLERS.get(type(field))
+    if handler is not None:
+        return handler(field)
+    # Subclasses (numpy floats, SDK mappings built on dict, ...)
     if isinstance(field, (str, int, float)):
         return field, None
     if isinstance(field, dict):
-        conf = field.get("confidence")
-        if isinstance(field.get("valueCurrency"), dict):
-            return field["valueCurrency"].get("amount"), conf
-        if "valueNumber" in field:
-            return field.get("valueNumber"), conf
-        if "valueString" in field:
-            return field.get("valueString"), conf
-        if "content" in field:
-            return field.get("content"), conf
-        return str(field), conf
+        return _dict_val_conf(field)
 
     val = getattr(field, "value", None)
     conf = getattr(field, "confidence", None)
@@ -141,11 +265,18 @@ def safe_eval_maybe(s):
         return s
     if not isinstance(s, str):
         return s
+    # Azure payloads are JSON-shaped, so objects/arrays try the JSON parser first
+    # and only fall back to literal_eval for Python reprs (single quotes, None, ...)
+    if s.lstrip()[:1] in ("{", "["):
+        try:
+            return json_loads(s)
+        except Exception:
+            pass
     try:
         return ast.literal_eval(s)
     except Exception:
         try:
-            return json.loads(s.replace("'", '"'))
+            return json.loads(s.translate(QUOTE_TRANS))
         except Exception:
             return s
 
@@ -195,7 +326,7 @@ def extract_cgst_sgst_from_content(item_content, tax_amount):
         return None, None
 
     content_str = str(item_content)
-    rate_pattern = re.findall(r'(\d+(?:\.\d+)?)%', content_str)
+    rate_pattern = RATE_RE.findall(content_str)
 
     if len(rate_pattern) >= 2 and rate_pattern[0] == rate_pattern[1]:
         return tax_amount, tax_amount
@@ -203,24 +334,43 @@ def extract_cgst_sgst_from_content(item_content, tax_amount):
     return None, None
 
 
+def _item_keys(*keys):
+    # Each key followed by its lowercase spelling, the order pick() tries them in
+    return tuple(dict.fromkeys(alt for k in keys for alt in (k, k.lower())))
+
+
+# Azure item field names per normalised field, lowercase variants precomputed
+OCR_ITEM_KEYS = (
+    _item_keys("ProductCode", "Material", "MaterialNo", "SKU"),
+    _item_keys("Description", "DescriptionText", "Name"),
+    _item_keys("Quantity", "Qty"),
+    _item_keys("UnitPrice", "Unit Price"),
+    _item_keys("Amount", "LineTotal", "Total"),
+    _item_keys("Tax", "TaxAmount"),
+    _item_keys("TaxRate"),
+    _item_keys("CGST"),
+    _item_keys("SGST"),
+)
+
+
 def normalize_ocr_item(item):
-    def pick(*keys):
+    def pick(keys):
         for k in keys:
             if k in item:
                 return get_val_conf(item[k])
-            if k.lower() in item:
-                return get_val_conf(item[k.lower()])
         return None, None
 
-    sku, sku_conf = pick("ProductCode", "Material", "MaterialNo", "SKU")
-    name, name_conf = pick("Description", "DescriptionText", "Name")
-    qty_raw, qty_conf = pick("Quantity", "Qty")
-    unit_raw, unit_conf = pick("UnitPrice", "Unit Price")
-    amt_raw, amt_conf = pick("Amount", "LineTotal", "Total")
-    tax_raw, tax_conf = pick("Tax", "TaxAmount")
-    taxrate_raw, taxrate_conf = pick("TaxRate")
-    cgst_raw, cgst_conf = pick("CGST")
-    sgst_raw, sgst_conf = pick("SGST")
+    (
+        (sku, sku_conf),
+        (name, name_conf),
+        (qty_raw, qty_conf),
+        (unit_raw, unit_conf),
+        (amt_raw, amt_conf),
+        (tax_raw, tax_conf),
+        (taxrate_raw, taxrate_conf),
+        (cgst_raw, cgst_conf),
+        (sgst_raw, sgst_conf),
+    ) = [pick(keys) for keys in OCR_ITEM_KEYS]
 
     qty = parse_number(qty_raw)
     unit = parse_number(unit_raw)
@@ -277,7 +427,7 @@ def normalize_ocr_item(item):
         "TotalTax": total_tax,
         "LineTotalWithTax": line_total_with_tax,
         "avg_conf": avg_conf,
-        "raw_content": item.get("content") if "content" in item else None,
+        "raw_content": item_content,
     }
 
 
@@ -289,10 +439,11 @@ def find_your_reference(headers, ocr_items, raw_content=None, prefer_prefixes=No
         if text is None:
             return None
         txt = str(text)
-        candidates = re.findall(r"\b[A-Z]{2,}[0-9A-Z\-_/]{3,}\b", txt)
+        candidates = CAND_UP_RE.findall(txt)
         if not candidates:
-            candidates = re.findall(r"\b[A-Za-z0-9]{6,}\b", txt)
-        candidates = [c for c in candidates if not re.fullmatch(r"\d{6,}", c)]
+            candidates = CAND_ALNUM_RE.findall(txt)
+        digits_only = DIGITS_ONLY_RE.fullmatch
+        candidates = [c for c in candidates if not digits_only(c)]
         if not candidates:
             return None
         for p in prefer_prefixes:
@@ -301,28 +452,20 @@ def find_your_reference(headers, ocr_items, raw_content=None, prefer_prefixes=No
                     return c
         return candidates[0]
 
+    # A reference-like header wins as soon as it yields a candidate, so one pass
+    # over the headers covers both the preferred and the fallback pick
     fallback = None
     for k, v in headers.items():
         txt = v.get("value") if isinstance(v, dict) and "value" in v else v
         cand = scan_text_for_candidate(txt)
         if cand:
-            if any(t in k.lower() for t in ["reference", "your", "ref", "po"]):
+            k_low = k.lower()
+            if any(t in k_low for t in REF_KEY_TERMS):
                 return cand
             fallback = cand
 
-    for k, v in headers.items():
-        if any(t in k.lower() for t in ["reference", "your", "ref"]):
-            txt = v.get("value") if isinstance(v, dict) and "value" in v else v
-            cand = scan_text_for_candidate(txt)
-            if cand:
-                return cand
-
     if raw_content:
-        match = re.search(
-            r"Your\s+Reference[:\s]+([A-Z0-9]{6,})",
-            raw_content,
-            re.IGNORECASE,
-        )
+        match = YOUR_REF_RE.search(raw_content)
         if match:
             return match.group(1)
         cand = scan_text_for_candidate(raw_content)
@@ -338,41 +481,39 @@ def find_your_reference(headers, ocr_items, raw_content=None, prefer_prefixes=No
     return fallback
 
 
-def sum_invoice_tax(ocr_items):
-    total_cgst = 0.0
-    total_sgst = 0.0
-    total_tax = 0.0
-    saw_gst = False
-    saw_tax = False
+def _as_float(x):
+    if x is None:
+        return np.nan
+    try:
+        return float(x)
+    except Exception:
+        return np.nan
 
-    for it in ocr_items:
-        cgst = it.get("CGST")
-        sgst = it.get("SGST")
-        tax = it.get("Tax")
 
-        if cgst is not None:
-            try:
-                total_cgst += float(cgst)
-                saw_gst = True
-            except Exception:
-                pass
-        if sgst is not None:
-            try:
-                total_sgst += float(sgst)
-                saw_gst = True
-            except Exception:
-                pass
-        if tax is not None:
-            try:
-                total_tax += float(tax)
-                saw_tax = True
-            except Exception:
-                pass
+def ocr_item_arrays(ocr_items, fields=OCR_SUM_FIELDS):
+    # One float array per field (NaN = missing). The items are walked once into
+    # an items x fields table whose columns are split out, so every invoice
+    # total below is a NumPy reduction
+    table = np.array(
+        [[_as_float(it.get(f)) for f in fields] for it in ocr_items], dtype=np.float64
+    ).reshape(len(ocr_items), len(fields))
+    return dict(zip(fields, table.T))
+
+
+def sum_invoice_tax(ocr_items, arrays=None):
+    if arrays is None:
+        arrays = ocr_item_arrays(ocr_items)
+    cgst = arrays["CGST"]
+    sgst = arrays["SGST"]
+    tax = arrays["Tax"]
+
+    saw_gst = not (np.isnan(cgst).all() and np.isnan(sgst).all())
+    saw_tax = not np.isnan(tax).all()
 
     if saw_gst:
-        return total_cgst + total_sgst
+        return float(np.nansum(cgst) + np.nansum(sgst))
     elif saw_tax:
-        return total_tax
+        return float(np.nansum(tax))
     return None
 
 
@@ -387,29 +528,22 @@ def detect_header_row(df_no_header, header_keywords=None, max_scan=12):
             "item price",
             "base price",
         ]
-    for r in range(min(max_scan, df_no_header.shape[0])):
-        row = [
-            str(x).lower() if pd.notna(x) else ""
-            for x in df_no_header.iloc[r].astype(str).tolist()
-        ]
-        hits = sum(any(k in cell for cell in row) for k in header_keywords)
+    # Stringify the scanned rows once instead of per row and per pass
+    scan_rows = df_no_header.head(max_scan).astype(str).to_numpy().tolist()
+    for r, raw_row in enumerate(scan_rows):
+        # NUL-joined row: "k in line" is "k in any cell" in a single substring scan
+        line = "\x00".join(str(x).lower() if pd.notna(x) else "" for x in raw_row)
+        hits = sum(k in line for k in header_keywords)
         if hits >= 1:
-            if (
-                any("sku" in c for c in row)
-                or any("name" in c for c in row)
-                or any("po ref" in c for c in row)
-            ):
+            if "sku" in line or "name" in line or "po ref" in line:
                 return r
             if hits >= 2:
                 return r
-    for r in range(min(max_scan, df_no_header.shape[0])):
-        row = df_no_header.iloc[r].astype(str).tolist()
+    for r, row in enumerate(scan_rows):
         nonnum = sum(
             1
             for c in row
-            if not re.match(
-                r"^\s*$|^\d+(\.\d+)?$", str(c).replace(",", "").strip()
-            )
+            if not NUMLIKE_RE.match(str(c).replace(",", "").strip())
         )
         if nonnum >= max(1, len(row) // 3):
             return r
@@ -418,34 +552,32 @@ def detect_header_row(df_no_header, header_keywords=None, max_scan=12):
 
 def canonical_col(c):
     s = str(c).strip().lower()
-    s = s.replace("ean/upc", "ean_upc")
-    s = s.replace("po ref no", "po_ref_no").replace("po ref", "po_ref_no")
-    s = s.replace("ordered quantity", "ordered_quantity").replace(
-        "pending quantity", "pending_quantity"
-    )
-    s = s.replace("base price", "base_price").replace("item price", "item_price")
-    s = s.replace("tax rate", "tax_rate").replace("included tax", "included_tax").replace(
-        "total value", "total_value"
-    )
-    s = re.sub(r"\s+", "_", s)
-    s = re.sub(r"[^0-9a-z_]", "", s)
-    return s
+    s = CANON_COL_RE.sub(lambda m: CANON_COL_MAP[m.group(0)], s)
+    s = WS_RE.sub("_", s)
+    return s.translate(COL_CHARS)
 
 
 def clean_excel_file_from_upload(upload_file):
-    raw = pd.read_excel(upload_file, header=None, dtype=str)
+    raw = None
+    if EXCEL_ENGINE == "calamine":
+        try:
+            raw = pd.read_excel(upload_file, header=None, dtype=str, engine="calamine")
+        except Exception as e:
+            logger.warning(f"calamine could not read {getattr(upload_file, 'name', 'upload')}: {e}")
+            upload_file.seek(0)
+    if raw is None:
+        # Let pandas pick the engine (openpyxl for xlsx/xlsm, xlrd for legacy xls)
+        raw = pd.read_excel(upload_file, header=None, dtype=str)
     header_row = detect_header_row(raw)
     header_labels = raw.iloc[header_row].fillna("").astype(str).tolist()
     header_labels = [
         lbl if lbl.strip() != "" else f"col_{i}"
         for i, lbl in enumerate(header_labels)
     ]
-    df = raw.iloc[header_row + 1:].copy().reset_index(drop=True)
-    df.columns = header_labels
-    for c in df.columns:
-        df[c] = df[c].apply(lambda x: x.strip() if isinstance(x, str) else x)
-
-    df.columns = [canonical_col(c) for c in df.columns]
+    # dtype=str leaves only strings and NaN, so every column is stripped with the
+    # vectorised .str accessor while the positional labels are still unique
+    df = raw.iloc[header_row + 1:].reset_index(drop=True).apply(lambda col: col.str.strip())
+    df.columns = [canonical_col(lbl) for lbl in header_labels]
 
     po_candidates = [c for c in df.columns if "purchase" in c and "order" in c]
     if po_candidates:
@@ -495,22 +627,34 @@ def map_excel_to_ocr(excel_rows, ocr_lines):
                 mapping[ei] = found
                 used.add(found)
 
-    for ei, ex in enumerate(excel_rows):
-        if ei in mapping:
-            continue
-        ex_name = ex.get("name") or ex.get("Name") or ex.get("description") or ""
-        best_score = -1
-        best_oi = None
-        for oi, ol in enumerate(ocr_lines):
-            if oi in used:
-                continue
-            s = fuzzy_score(ol.get("Name", ""), ex_name)
-            if s > best_score:
-                best_score = s
-                best_oi = oi
-        if best_score >= NAME_THRESHOLD:
-            mapping[ei] = best_oi
-            used.add(best_oi)
+    # Name pass: score every unmapped Excel row against every OCR line in one
+    # cdist call, then hand out the best still-unused line row by row
+    pending = [ei for ei in range(len(excel_rows)) if ei not in mapping]
+    if pending and ocr_lines:
+        ex_names = []
+        for ei in pending:
+            ex = excel_rows[ei]
+            ex_name = ex.get("name") or ex.get("Name") or ex.get("description") or ""
+            ex_names.append(str(ex_name))
+        ocr_names = [
+            str(ol["Name"]) if ol.get("Name") is not None else "" for ol in ocr_lines
+        ]
+        # Truncated like fuzzy_score, so ties still go to the first OCR line
+        scores = np.floor(
+            process.cdist(
+                ex_names, ocr_names,
+                scorer=fuzz.token_sort_ratio, dtype=np.float64, workers=-1,
+            )
+        )
+        taken = np.zeros(len(ocr_lines), dtype=bool)
+        taken[list(used)] = True
+        for row, ei in enumerate(pending):
+            row_scores = np.where(taken, -1.0, scores[row])
+            best_oi = int(row_scores.argmax())
+            if row_scores[best_oi] >= NAME_THRESHOLD:
+                mapping[ei] = best_oi
+                used.add(best_oi)
+                taken[best_oi] = True
 
     for ei in range(len(excel_rows)):
         if ei not in mapping:
@@ -590,15 +734,17 @@ def compare_mapped_row(ex_row, ocr_line):
 # ======================================================================
 
 def save_summary_to_excel_bytes(summary_row: dict, cols: list):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "summary"
+    # Two rows only: xlsxwriter writes them straight out, without an openpyxl tree
+    bio = io.BytesIO()
+    wb = xlsxwriter.Workbook(
+        bio, {"in_memory": True, "strings_to_urls": False, "nan_inf_to_errors": True}
+    )
+    ws = wb.add_worksheet("summary")
 
-    ws.append(cols)
-    ws.append([summary_row.get(c) for c in cols])
+    ws.write_row(0, 0, cols)
+    ws.write_row(1, 0, [summary_row.get(c) for c in cols])
 
-    bio = io.BytesIO()
-    wb.save(bio)
+    wb.close()
     bio.seek(0)
     return bio
 
@@ -615,9 +761,11 @@ def get_azure_client(endpoint: str, key: str):
 def analyze_pdf_file_streamlit(pdf_file, client: DocumentIntelligenceClient):
     file_name = pdf_file.name
     logger.info(f"Analyzing PDF: {file_name}")
-    b = pdf_file.read()
+    # The upload is already a seekable in-memory stream; hand it to the SDK as is
+    # rather than copying its bytes into a second BytesIO
+    pdf_file.seek(0)
     poller = client.begin_analyze_document(
-        model_id="prebuilt-invoice", body=io.BytesIO(b)
+        model_id="prebuilt-invoice", body=pdf_file
     )
     res = poller.result()
 
@@ -670,7 +818,8 @@ def process_invoice_pair(pdf_file, excel_file, client: DocumentIntelligenceClien
         ocr_invoice_total = vt.get("value") if isinstance(vt, dict) else vt
     ocr_invoice_total_num = parse_number(ocr_invoice_total)
 
-    ocr_invoice_tax_total = sum_invoice_tax(ocr_items)
+    ocr_arrays = ocr_item_arrays(ocr_items)
+    ocr_invoice_tax_total = sum_invoice_tax(ocr_items, ocr_arrays)
 
     ocr_subtotal = None
     if "SubTotal" in headers:
@@ -678,15 +827,15 @@ def process_invoice_pair(pdf_file, excel_file, client: DocumentIntelligenceClien
         ocr_subtotal = stf.get("value") if isinstance(stf, dict) else stf
     ocr_subtotal_num = parse_number(ocr_subtotal)
 
-    total_cgst = sum(it.get("CGST") or 0.0 for it in ocr_items)
-    total_sgst = sum(it.get("SGST") or 0.0 for it in ocr_items)
+    total_cgst = float(np.nansum(ocr_arrays["CGST"]))
+    total_sgst = float(np.nansum(ocr_arrays["SGST"]))
 
     calculated_total = None
     if ocr_subtotal_num is not None:
         calculated_total = ocr_subtotal_num + total_cgst + total_sgst
 
     # Total quantity from OCR
-    ocr_total_qty = sum((it.get("Quantity") or 0.0) for it in ocr_items)
+    ocr_total_qty = float(np.nansum(ocr_arrays["Quantity"]))
 
     cleaned = clean_excel_file_from_upload(excel_file)
     excel_rows = cleaned.to_dict("records")
@@ -696,7 +845,7 @@ def process_invoice_pair(pdf_file, excel_file, client: DocumentIntelligenceClien
     if "ordered_quantity" in cleaned.columns:
         col = cleaned["ordered_quantity"].dropna()
         if not col.empty:
-            excel_total_qty = col.apply(parse_number).dropna().sum()
+            excel_total_qty = parse_number_series(col).dropna().sum()
 
     # PO ref from Excel
     excel_po_ref = None
@@ -735,13 +884,13 @@ def process_invoice_pair(pdf_file, excel_file, client: DocumentIntelligenceClien
     if "included_tax" in cleaned.columns:
         col = cleaned["included_tax"].dropna()
         if not col.empty:
-            excel_included_tax_sum = col.apply(parse_number).dropna().sum()
+            excel_included_tax_sum = parse_number_series(col).dropna().sum()
 
     excel_total_value_sum = None
     if "total_value" in cleaned.columns:
         col = cleaned["total_value"].dropna()
         if not col.empty:
-            excel_total_value_sum = col.apply(parse_number).dropna().sum()
+            excel_total_value_sum = parse_number_series(col).dropna().sum()
 
     invoice_summary = {
         "ocr_invoice_ref": ocr_ref,
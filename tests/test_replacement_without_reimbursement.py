@@ -0,0 +1,63 @@
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from streamlit.proto.Common_pb2 import FileURLs
+from streamlit.runtime.uploaded_file_manager import UploadedFile, UploadedFileRec
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULE_PATH = ROOT / "modules" / "leakagereconciliation" / "Replacement-without-Reimbursement.py"
+
+
+@pytest.fixture(scope="module")
+def rwr():
+    # common.mongo connects at import time; the report helpers never touch it.
+    sys.path.insert(0, str(ROOT))
+    sys.modules["common.mongo"] = types.ModuleType("common.mongo")
+    spec = importlib.util.spec_from_file_location("replacement_without_reimbursement", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def upload(name, frame):
+    data = frame.to_csv(index=False).encode()
+    return UploadedFile(UploadedFileRec(name, name, "text/csv", data), FileURLs())
+
+
+def uploads():
+    replace = pd.DataFrame({
+        **{f"col{i}": ["x", "y"] for i in range(6)},
+        "shipment-date": ["2024-01-05T10:20:30+00:00", "2024-02-05T10:20:30+00:00"],
+        "replacement-order-id": ["R1", "R2"],
+        "original-order-id": ["O1", "O2"],
+    })
+    returns = pd.DataFrame({
+        "c0": ["a", "b"], "order-id": ["O1", "R1"],
+        **{f"c{i}": ["a", "b"] for i in range(2, 8)},
+        "detailed-disposition": ["CUSTOMER_DAMAGED", "CARRIER_DAMAGED"],
+    })
+    refund = pd.DataFrame({**{f"c{i}": ["a"] for i in range(4)}, "order-id": ["O2"]})
+    bulk_rto = pd.DataFrame({"order-id": ["O9"]})
+    reimbursement = pd.DataFrame({"amazon-order-id": ["O1"], "reason": ["CustomerReturn"]})
+    return [
+        upload("replace.csv", replace),
+        upload("return.csv", returns),
+        upload("refund.csv", refund),
+        upload("bulk_rto.csv", bulk_rto),
+        upload("reimbursement.csv", reimbursement),
+    ]
+
+
+def test_csv_upload_reports_export_to_excel(rwr):
+    from common.ui_utils import to_excel
+
+    results = rwr.process_replacement_data(*uploads(), days_threshold=0)
+
+    assert results["damaged_count"] == 1
+    assert results["refund_count"] == 1
+    for key in ("damaged_returns", "refund_without_return", "main"):
+        assert to_excel(results[key])[:2] == b"PK"
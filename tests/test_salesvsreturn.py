@@ -0,0 +1,86 @@
+import importlib
+import io
+import sys
+import types
+import zipfile
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def svr():
+    # common.mongo connects at import time; the report helpers never touch it.
+    sys.path.insert(0, str(ROOT))
+    fake_mongo = types.ModuleType("common.mongo")
+    fake_mongo.save_reconciliation_report = lambda *args, **kwargs: None
+    sys.modules["common.mongo"] = fake_mongo
+    return importlib.import_module("modules.amazon.SalesvsReturn")
+
+
+def combined():
+    return pd.DataFrame({
+        "Brand": ["Alpha", "Beta", "Alpha", "Gamma"],
+        "Asin": ["B001", "B002", "B001", "B003"],
+        "Quantity": [1, 2, 3, 0],
+    })
+
+
+@pytest.mark.parametrize("pivot_name", ["create_brand_pivot", "create_asin_pivot"])
+def test_no_returns_path_has_single_grand_total(svr, pivot_name):
+    qty_pivot = getattr(svr, pivot_name)(combined())
+    before = qty_pivot.copy()
+    key = qty_pivot.columns[0]
+
+    # Even if the final summary shares the pivot object, each gets one total.
+    final = qty_pivot
+    qty_pivot = svr.add_grand_total(qty_pivot)
+    final = svr.add_grand_total(final)
+
+    for frame in (qty_pivot, final):
+        assert (frame[key] == "Grand Total").sum() == 1
+        assert frame.iloc[-1]["Quantity"] == 6
+        assert len(frame) == len(before) + 1
+
+
+def test_add_grand_total_leaves_input_unchanged(svr):
+    qty_pivot = svr.create_brand_pivot(combined())
+    before = qty_pivot.copy()
+
+    svr.add_grand_total(qty_pivot)
+    svr.add_grand_total(qty_pivot)
+
+    pd.testing.assert_frame_equal(qty_pivot, before)
+
+
+class Upload(io.BytesIO):
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def zipped(name, frame):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("report.csv", frame.to_csv(index=False))
+    return Upload(name, buffer.getvalue())
+
+
+def test_zip_uploads_are_written_in_upload_order(svr):
+    uploads = [
+        zipped(f"part{i}.zip", pd.DataFrame({"Asin": [f"B{i}"], "Quantity": [i]}))
+        for i in range(5)
+    ]
+
+    path, total = svr.read_zip_files_to_disk(uploads)
+    try:
+        written = pd.read_csv(path)
+    finally:
+        svr.remove_temp_file(path)
+
+    assert total == 5
+    assert written["Source_Zip"].tolist() == [f"part{i}.zip" for i in range(5)]
+    assert written["Quantity"].tolist() == list(range(5))